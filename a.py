@@ -1,12 +1,24 @@
+import argparse
+import hashlib
 import os
 import sys
+import threading
+import time
 import traceback
+import numpy as np
 import pandas as pd
-import mysql.connector
-from mysql.connector import errorcode
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import backends
+from excel_cache import read_excel_cached
+from cleaning import SCHEMAS, apply_schema, drop_duplicate_rows, normalize_text
+import profiler
+from reports import refresh_reports
+from validation import Rejects, db_rejects, frame_rows, validate
 
 # ======== CONFIG ========
-BASE_PATH = r"C:\Users\medha\OneDrive\Desktop\Vaccination"  # folder with Excel files
+# The folder and DB settings can also come from the environment (see cli.py).
+BASE_PATH = os.environ.get("VACCINATION_DATA_DIR",
+                           r"C:\Users\medha\OneDrive\Desktop\Vaccination")  # folder with Excel files
 FILES = {
     "coverage":      "cleaned_coverage_data.xlsx",
     "incidence":     "cleaned_incidence_rate_data.xlsx",
@@ -15,20 +27,73 @@ FILES = {
     "schedule":      "cleaned_vaccine_schedule_data.xlsx",
 }
 DB = dict(
-    host="localhost",
-    user="root",
-    password="123456",      # <<< change me
-    database="vaccination",      # <<< change me
+    host=os.environ.get("VACCINATION_DB_HOST", "localhost"),
+    port=int(os.environ.get("VACCINATION_DB_PORT", 3306)),
+    user=os.environ.get("VACCINATION_DB_USER", "root"),
+    password=os.environ.get("VACCINATION_DB_PASSWORD", "123456"),      # <<< change me
+    database=os.environ.get("VACCINATION_DB_NAME", "vaccination"),      # <<< change me
 )
+# mysql, or sqlite / duckdb for a local file (see backends.py)
+BACKEND = os.environ.get("VACCINATION_BACKEND", "mysql")
+BATCH_SIZE = 1000   # rows per multi-row INSERT for the fact tables
+CHUNK_ROWS = 50000  # rows per chunk with --stream
+JOBS = 4            # fact tables loaded (and workbooks read) in parallel
+FINGERPRINT_TABLE = "load_fingerprints"   # natural-key -> row hash, for --incremental
+CHECKPOINT_TABLE = "load_checkpoints"     # source rows committed per fact table, for --resume
+CHECKPOINT_ROWS = 50000                   # --resume without --checkpoint-every commits this often
+IN_FLIGHT = 8       # batches queued ahead of the connections with --async
+REJECTS_DIR = "rejects"   # per-table files of rows that failed validation, under BASE_PATH
 
 # ======== UTILITIES ========
-def safe_read_excel(path):
+def source_path(path):
+    """Full path to read for one of FILES.
+
+    clean_excel.py writes a Parquet twin of each cleaned_*.xlsx; it is used
+    instead of the workbook unless the workbook is newer.
+    """
     fp = os.path.join(BASE_PATH, path)
+    twin = os.path.splitext(fp)[0] + ".parquet"
+    if os.path.exists(twin) and (not os.path.exists(fp) or os.path.getmtime(twin) >= os.path.getmtime(fp)):
+        return twin
+    return fp
+
+def safe_read_excel(path, use_cache=True, schema=None):
+    """Read one of FILES, cast to schema (see cleaning.SCHEMAS); None if unreadable."""
+    fp = source_path(path)
+    if not os.path.exists(fp):
+        print(f"⚠️  Missing file: {path} (skipping)")
+        return None
+    try:
+        if fp.endswith(".parquet"):
+            return apply_schema(pd.read_parquet(fp), schema)
+        if use_cache:
+            return apply_schema(read_excel_cached(fp), schema)
+        return apply_schema(pd.read_excel(fp), schema)
+    except PermissionError:
+        print(f"⚠️  Permission denied reading {path}. "
+              f"Close the file in Excel/OneDrive and re-run. Skipping for now.")
+        return None
+    except Exception as e:
+        print(f"⚠️  Could not read {path}: {e}. Skipping.")
+        return None
+
+def safe_stream_excel(path, chunk_rows=CHUNK_ROWS, schema=None):
+    """Like safe_read_excel, but returns an iterator of DataFrame chunks.
+
+    The workbook is opened in openpyxl read-only mode and rows are pulled
+    chunk_rows at a time, so only one chunk is held in memory.
+    """
+    fp = source_path(path)
     if not os.path.exists(fp):
         print(f"⚠️  Missing file: {path} (skipping)")
         return None
     try:
-        return pd.read_excel(fp)
+        if fp.endswith(".parquet"):
+            import pyarrow.parquet as pq
+            chunks = _iter_parquet(pq.ParquetFile(fp), chunk_rows)
+        else:
+            import openpyxl
+            chunks = _iter_chunks(openpyxl.load_workbook(fp, read_only=True, data_only=True), chunk_rows)
     except PermissionError:
         print(f"⚠️  Permission denied reading {path}. "
               f"Close the file in Excel/OneDrive and re-run. Skipping for now.")
@@ -36,14 +101,38 @@ def safe_read_excel(path):
     except Exception as e:
         print(f"⚠️  Could not read {path}: {e}. Skipping.")
         return None
+    return (apply_schema(df, schema) for df in chunks)
+
+def _iter_chunks(wb, chunk_rows):
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(h) if h is not None else f"Unnamed: {i}" for i, h in enumerate(next(rows, ()))]
+        batch = []
+        for r in rows:
+            if all(v is None for v in r):
+                continue   # read_excel skips blank rows too
+            batch.append(r[:len(header)])
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        wb.close()
 
-def get_table_columns(cur, table):
-    cur.execute("""
-        SELECT COLUMN_NAME
-        FROM INFORMATION_SCHEMA.COLUMNS
-        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
-    """, (table,))
-    return {r[0].lower() for r in cur.fetchall()}
+def _iter_parquet(pf, chunk_rows):
+    try:
+        for batch in pf.iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    finally:
+        pf.close()
+
+def clean_frame(df):
+    """Trim headers and text cells and drop duplicate rows, in place."""
+    df.columns = df.columns.str.strip()
+    normalize_text(df)
+    drop_duplicate_rows(df)
+    return df
 
 def choose(colset, *candidates):
     """Pick the first existing column from candidates (case-insensitive)."""
@@ -52,429 +141,965 @@ def choose(colset, *candidates):
             return c.lower()
     return None
 
-def fetch_id_map(cur, table, key_col, id_col="id"):
-    """Return a dict key -> id for a master table."""
-    cur.execute(f"SELECT {id_col}, {key_col} FROM {table}")
-    m = {}
-    for _id, key in cur.fetchall():
-        if key is None:
-            continue
-        m[str(key).strip().upper()] = _id
-    return m
+class Metadata:
+    """Schema and master-key cache for one load.
 
-def normalize_str(x):
-    if pd.isna(x):
-        return None
-    return str(x).strip()
+    All column names (with type and length) come from a single
+    introspection query, and each master table is read once into
+    key -> id maps. Master rows inserted during the load are added to the
+    maps as they go in, so the tables never have to be re-read. With
+    dry_run (--validate) upsert_master only adds them to the maps, and
+    tables the backend would create are described by their planned columns.
+    """
 
-def to_int(x):
-    try:
-        if pd.isna(x) or x == "":
-            return None
-        return int(float(x))
-    except Exception:
-        return None
+    def __init__(self, cur, dry_run=False):
+        self.dry_run = dry_run
+        self.tables = {}
+        for table, col, data_type, max_len in cur.backend.columns(cur):
+            self.tables.setdefault(table.lower(), {})[col.lower()] = (data_type, max_len)
+        self.absent = set()     # tables only planned, not in the database
+        if dry_run:
+            for table, col, data_type, max_len in cur.backend.planned_columns():
+                if table in self.absent or table not in self.tables:
+                    self.absent.add(table)
+                    self.tables.setdefault(table, {})[col] = (data_type, max_len)
+        self.maps = {}
+        self.master_keys = {}   # table -> (id column, {map name: key column})
+
+    def columns(self, table):
+        return set(self.tables.get(table.lower(), {}))
+
+    def load_maps(self, cur):
+        """Read every master table with one query returning the id and all key columns."""
+        c_cols = self.columns("countries")
+        c_id = choose(c_cols, "country_id", "id")
+        c_iso = choose(c_cols, "iso_code", "iso3", "code", "iso_3_code")
+        if not (c_id and c_iso):
+            print("❌ countries table must have id & iso_code (or synonyms).")
+            sys.exit(1)
+        v_cols = self.columns("vaccines")
+        d_cols = self.columns("diseases")
+        self.master_keys = {
+            "countries": (c_id, {"country": c_iso}),
+            "vaccines": (choose(v_cols, "vaccine_id", "id"),
+                         {"vac_code": choose(v_cols, "vaccine_code"),
+                          "vac_name": choose(v_cols, "vaccine_name", "vaccine")}),
+            "diseases": (choose(d_cols, "disease_id", "id"),
+                         {"dis_code": choose(d_cols, "disease_code"),
+                          "dis_name": choose(d_cols, "disease", "name")}),
+        }
+        for table, (id_col, keys) in self.master_keys.items():
+            for name in keys:
+                self.maps[name] = {}
+            keys = {name: col for name, col in keys.items() if col}
+            if not (id_col and keys) or table in self.absent:
+                continue
+            cols = list(dict.fromkeys(keys.values()))
+            for row_id, vals in cur.backend.fetch_keys(cur, table, id_col, cols):
+                for name, col in keys.items():
+                    if vals[col] is not None:
+                        self.maps[name][str(vals[col]).strip().upper()] = row_id
+
+    def known(self, table, col, value):
+        """True if value is already present in the map keyed on table.col."""
+        for name, key in self.master_keys.get(table, (None, {}))[1].items():
+            if key == col and str(value).strip().upper() in self.maps[name]:
+                return True
+        return False
 
-def to_dec(x):
+    def remember(self, table, rows):
+        """Add freshly inserted master rows, as (column -> value dict, id) pairs, to the maps.
+
+        Maps are replaced rather than mutated, since loader threads may be
+        reading them concurrently.
+        """
+        rows = list(rows)
+        for name, col in self.master_keys.get(table, (None, {}))[1].items():
+            if not col:
+                continue
+            updated = dict(self.maps[name])
+            for row, new_id in rows:
+                if row.get(col) is not None:
+                    updated[str(row[col]).strip().upper()] = new_id
+            self.maps[name] = updated
+
+def insert_batched(cur, sql, rows, batch_size=BATCH_SIZE):
+    """Insert rows with executemany in chunks of batch_size.
+
+    The MySQL and DuckDB backends turn executemany on an INSERT ... VALUES
+    into a single multi-row statement, so each chunk is one round trip. If a chunk fails it
+    is split in half and retried until the bad rows are isolated; only those
+    are skipped. Returns (inserted, rejected) with rejected as (row, error).
+    """
+    inserted, rejected = 0, []
+    for start in range(0, len(rows), batch_size):
+        n, bad = _insert_chunk(cur, sql, rows[start:start + batch_size])
+        inserted += n
+        rejected.extend(bad)
+    return inserted, rejected
+
+def _insert_chunk(cur, sql, rows):
     try:
-        if pd.isna(x) or x == "":
-            return None
-        return float(x)
-    except Exception:
-        return None
+        cur.executemany(sql, rows)
+        return len(rows), []
+    except Exception as e:
+        if len(rows) == 1:
+            return 0, [(rows[0], e)]
+        mid = len(rows) // 2
+        n1, bad1 = _insert_chunk(cur, sql, rows[:mid])
+        n2, bad2 = _insert_chunk(cur, sql, rows[mid:])
+        return n1 + n2, bad1 + bad2
 
-# ======== MAIN ========
-def main():
-    # connect db
+# ======== COLUMNAR HELPERS ========
+# Source columns as stripped text, truncated integers and floats, converted a
+# whole column at a time; anything unparsable becomes missing. Missing source
+# columns come back as all-None.
+def str_col(df, name):
+    out = pd.Series(None, index=df.index, dtype=object)
+    if name in df.columns:
+        s = df[name]
+        mask = s.notna()
+        out[mask] = s[mask].astype(str).str.strip()
+    return out
+
+def key_col(df, name):
+    """Normalized lookup key (stripped, upper-cased) for an id map."""
+    return str_col(df, name).str.upper()
+
+def int_col(df, name):
+    if name not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    v = pd.to_numeric(df[name], errors="coerce").astype("float64")
+    v = np.trunc(v.replace([np.inf, -np.inf], np.nan))
+    if ((v < -2.0 ** 63) | (v >= 2.0 ** 63)).any():
+        # too big even for Int64: left as floats, for validation's type: check
+        # to reject those rows
+        return v
+    return v.astype("Int64")
+
+def dec_col(df, name):
+    if name not in df.columns:
+        return pd.Series(None, index=df.index, dtype=object)
+    v = pd.to_numeric(df[name], errors="coerce")
+    if v.dtype == np.float32:
+        # widen through the shortest repr, so 93.2f goes in as 93.2 rather
+        # than 93.19999694824219
+        v = v.astype(str).astype("float64")
+    return v.astype("float64").replace([np.inf, -np.inf], np.nan)
+
+def fact_frame(values, cols):
+    """The per-column Series as one frame, in cols order, indexed by source row position.
+
+    Rows whose ids did not resolve are kept (with missing ids) for
+    validation.validate to reject.
+    """
+    return pd.DataFrame({c: values[c].reset_index(drop=True) for c in cols}, columns=cols)
+
+# ======== FACT WRITERS ========
+def write_fact(cur, table, cols, rows, opts):
+    """Write resolved fact rows with the method selected on the command line.
+
+    rows is a fact frame or a list of insert tuples. Frames go in whole on a
+    columnar backend (DuckDB); otherwise they are turned into tuples.
+    Returns (inserted, rejected); rejected rows are only itemised by the
+    batched path, so callers count skips as len(rows) - inserted.
+    """
+    backend = cur.backend
+    if isinstance(rows, pd.DataFrame):
+        if backend.columnar:
+            try:
+                return backend.insert_frame(cur, table, cols, rows), []
+            except backend.Error as err:
+                print(f"⚠️  Frame insert into {table} failed ({err}); falling back to batched inserts.")
+        rows = frame_rows(rows)
+    if opts.bulk:
+        try:
+            return backend.bulk_insert(cur, table, cols, rows), []
+        except backend.Error as err:
+            print(f"⚠️  Bulk load into {table} failed ({err}); falling back to batched inserts.")
+    return insert_batched(cur, backend.insert_sql(table, cols), rows, opts.batch_size)
+
+def load_fact(cnx, cur, meta, table, cols, frames, resolve, opts, key_cols=(), source=None):
+    """Resolve, validate and write one fact table's cleaned frames, commit, and print the counts.
+
+    frames is a single cleaned frame in a list, or one per chunk with
+    --stream; resolve turns a frame into a fact frame. Rows failing
+    validation are written to the table's rejects file instead of being
+    sent, and show up in the skipped count. With --incremental only rows
+    whose natural key (key_cols) is new or whose content changed are sent.
+    With --checkpoint-every / --resume the rows are committed in slices and
+    progress through source (a FILES key) is recorded, see CHECKPOINTS.
+
+    Returns {table: (country_id, year) pairs written}, for refresh_reports.
+    """
+    checkpoint = bool(opts.checkpoint_every or opts.resume)
+    skip = 0
+    if checkpoint:
+        signature = source_signature(source, opts)
+        skip = open_checkpoint(cur, table, signature, opts.resume)
+        if skip is None:
+            print(f"⏭️  {table}: already fully loaded by the checkpointed run, skipping")
+            return {table: set()}
+    t0 = time.perf_counter()
+    print(f"⏳ {table}: loading..." + (f" (resuming after source row {skip})" if skip else ""))
+    key_cols = [c for c in key_cols if c]
+    incremental = opts.incremental and key_cols
+    if opts.incremental and not key_cols:
+        print(f"⚠️  {table}: no natural-key columns found; loading all rows.")
+    # (country_id, year) partitions written to, for refresh_reports
+    part = [c for c in (choose(cols, "country_id"), choose(cols, "year")) if c]
+    touched = set()
+    if incremental:
+        loaded, adopt = open_fingerprints(cur, table)
+        if adopt:
+            print(f"⚠️  {table}: rows from a plain load have no fingerprints; replacing them all.")
+            if len(part) == 2:
+                cur.execute(f"SELECT DISTINCT {', '.join(part)} FROM {table}")
+                touched.update(cur.fetchall())
+            cur.execute(f"DELETE FROM {table}")
+            skip = 0   # a checkpoint from a plain load does not cover the reload
+
+    every = (opts.checkpoint_every or CHECKPOINT_ROWS) if checkpoint else 0
+    rejects = Rejects(table, opts.rejects_dir, opts.rejects_format, keep=opts.resume)
+    n_source = inserted = unchanged = updated = 0
     try:
-        cnx = mysql.connector.connect(**DB)
-    except mysql.connector.Error as err:
-        print("❌ DB connection failed:", err)
+        for df in slice_frames(frames, every, skip):
+            n_source += len(df)
+            fact, reasons = validate(resolve(df), meta.tables.get(table, {}))
+            rejects.add(df, reasons)
+            rows = fact
+            if incremental:
+                # one row per natural key: the last one wins, the others are rejected
+                dup = fact.duplicated(key_cols, keep="last").to_numpy()
+                if dup.any():
+                    rejects.add(df, pd.Series("duplicate_key", index=fact.index[dup], dtype=object))
+                    fact = fact[~dup]
+                rows, changed, same, hashes = diff_fingerprints(cols, frame_rows(fact), key_cols, loaded)
+                unchanged += same
+                updated += delete_by_key(cur, table, key_cols, changed)
+
+            n_ins, rejected = write_fact(cur, table, cols, rows, opts)
+            inserted += n_ins
+            refused = db_rejects(fact, rejected) if rejected else pd.Series([], dtype=object)
+            rejects.add(df, refused)
+            if len(part) == 2:
+                if incremental:
+                    failed = {row for row, _ in rejected}
+                    written = pd.DataFrame([row for row in rows if row not in failed], columns=cols)
+                    if set(part) <= set(key_cols):
+                        # a changed row whose replacement was refused is still gone
+                        touched.update(partitions(pd.DataFrame(changed, columns=key_cols), part))
+                else:
+                    written = fact.drop(index=refused.index)
+                touched.update(partitions(written, part))
+            if incremental:
+                failed = {key_hash(cols, key_cols, row) for row, _ in rejected}
+                hashes = [h for h in hashes if h[0] not in failed]
+                record_fingerprints(cur, table, hashes, opts.batch_size)
+                loaded.update(hashes)
+            if checkpoint:
+                save_checkpoint(cur, table, signature, skip + n_source)
+                cnx.commit()
+    finally:
+        rejects.close()
+    if checkpoint:
+        save_checkpoint(cur, table, signature, skip + n_source, complete=True)
+    cnx.commit()
+    profiler.count(rows=n_source)
+
+    skipped = n_source - inserted - unchanged
+    took = time.perf_counter() - t0
+    if incremental:
+        print(f"✅ {table}: inserted {inserted} ({updated} updated), unchanged {unchanged}, "
+              f"skipped {skipped} [{took:.1f}s]")
+    else:
+        print(f"✅ {table}: inserted {inserted}, skipped {skipped} [{took:.1f}s]")
+    if rejects.count:
+        print(f"⚠️  {table}: {rejects.summary()}")
+    return {table: touched}
+
+def partitions(frame, part):
+    """Distinct non-missing values of the part columns of frame, as tuples."""
+    return set(frame[part].dropna().drop_duplicates().itertuples(index=False, name=None))
+
+# ======== INCREMENTAL LOADS ========
+# Each loaded fact row is remembered in FINGERPRINT_TABLE as
+# (table, hash of its natural key, hash of the whole row). A re-run only
+# sends rows whose key is unknown or whose row hash differs; changed rows
+# are deleted by natural key (indexed, see create_key_indexes) and re-inserted.
+def row_hash(values):
+    digest = hashlib.blake2b(repr(tuple(values)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+def key_hash(cols, key_cols, row):
+    return row_hash(row[cols.index(c)] for c in key_cols)
+
+def create_fingerprint_table(cur):
+    # run once from main() before the loader threads start: DDL from
+    # several connections at once conflicts on DuckDB
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE} (
+            table_name VARCHAR(64) NOT NULL,
+            key_hash BIGINT NOT NULL,
+            row_hash BIGINT NOT NULL,
+            PRIMARY KEY (table_name, key_hash)
+        )
+    """)
+
+def create_key_indexes(cur, meta, tables):
+    """Index each table's natural key, so delete_by_key finds its rows without a scan.
+
+    Run once from main(), like create_fingerprint_table.
+    """
+    have = {(t.lower(), i.lower()) for t, i in cur.backend.indexes(cur)}
+    for table in tables:
+        _, _, key_cols = compile_mapping(table, meta)
+        name = f"ix_{table}_natural_key"
+        if not key_cols or (table, name) in have:
+            continue
+        try:
+            cur.execute(f"CREATE INDEX {name} ON {table} ({', '.join(key_cols)})")
+            print(f"✅ index {name} created on {table}({', '.join(key_cols)})")
+        except cur.backend.Error as err:
+            print(f"⚠️  Could not index the natural key of {table} ({err}); changed rows will be slow to replace.")
+
+def open_fingerprints(cur, table):
+    """Return (loaded, adopt): key_hash -> row_hash for table, and whether
+    the table holds rows from a plain load that were never fingerprinted."""
+    # fingerprints are meaningless for a table that has been emptied since
+    cur.execute(f"SELECT 1 FROM {table} LIMIT 1")
+    has_rows = bool(cur.fetchall())
+    if not has_rows:
+        cur.execute(f"DELETE FROM {FINGERPRINT_TABLE} WHERE table_name = %s", (table,))
+    cur.execute(f"SELECT key_hash, row_hash FROM {FINGERPRINT_TABLE} WHERE table_name = %s", (table,))
+    loaded = dict(cur.fetchall())
+    # a table filled by a plain load has no fingerprints yet: load_fact empties
+    # it and loads it again, so the first incremental run doesn't duplicate it
+    return loaded, has_rows and not loaded
+
+def diff_fingerprints(cols, rows, key_cols, loaded):
+    """Split incoming rows against what was loaded before.
+
+    rows must not repeat a natural key (load_fact rejects the duplicates).
+    Returns (to_write, changed_keys, unchanged, hashes): the new or changed
+    rows, the natural-key tuples to delete first, the number of rows already
+    loaded as-is, and (key_hash, row_hash) pairs for to_write.
+    """
+    idx = [cols.index(c) for c in key_cols]
+    incoming = {row_hash(row[i] for i in idx): row for row in rows}
+
+    to_write, changed, hashes, unchanged = [], [], [], 0
+    for k, row in incoming.items():
+        h = row_hash(row)
+        old = loaded.get(k)
+        if old == h:
+            unchanged += 1
+            continue
+        if old is not None:
+            changed.append(tuple(row[i] for i in idx))
+        to_write.append(row)
+        hashes.append((k, h))
+    return to_write, changed, unchanged, hashes
+
+def delete_by_key(cur, table, key_cols, keys):
+    if not keys:
+        return 0
+    where = " AND ".join(f"{c} {cur.backend.null_safe_eq} %s" for c in key_cols)
+    cur.executemany(f"DELETE FROM {table} WHERE {where}", keys)
+    return len(keys)
+
+def record_fingerprints(cur, table, hashes, batch_size=BATCH_SIZE):
+    sql = cur.backend.upsert_sql(FINGERPRINT_TABLE, ["table_name", "key_hash", "row_hash"],
+                                 ["table_name", "key_hash"])
+    rows = [(table, k, h) for k, h in hashes]
+    for start in range(0, len(rows), batch_size):
+        cur.executemany(sql, rows[start:start + batch_size])
+
+# ======== CHECKPOINTS ========
+# With --checkpoint-every N a fact table is committed every N source rows,
+# and the same transaction records in CHECKPOINT_TABLE how many of its
+# (cleaned) source rows are in. --resume skips that many rows, so a crashed
+# load carries on where it stopped without inserting anything twice. The
+# source signature (file, size, mtime, read mode) keeps a checkpoint from
+# being applied to a different file, or to chunks cut differently.
+def source_signature(key, opts):
+    fp = source_path(FILES[key])
+    st = os.stat(fp)
+    mode = f"stream:{opts.chunk_rows}" if opts.stream else "full"
+    return f"{os.path.basename(fp)}|{st.st_size}|{st.st_mtime_ns}|{mode}"
+
+def create_checkpoint_table(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+            table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+            source VARCHAR(255) NOT NULL,
+            rows_done BIGINT NOT NULL,
+            complete TINYINT NOT NULL DEFAULT 0
+        )
+    """)
+
+def open_checkpoint(cur, table, signature, resume):
+    """Return the number of source rows to skip, or None if table's load completed."""
+    if not resume:
+        return 0
+    cur.execute(f"SELECT source, rows_done, complete FROM {CHECKPOINT_TABLE} WHERE table_name = %s", (table,))
+    found = cur.fetchall()
+    if not found:
+        return 0
+    source, rows_done, complete = found[0]
+    if source != signature:
+        return 0   # nothing was committed from the old source, see stale_checkpoints
+    return None if complete else rows_done
+
+def stale_checkpoints(cur, tables, opts):
+    """Tables with rows committed from a different source than the one --resume would read.
+
+    Loading such a table from the start would insert those rows a second
+    time, so main() refuses to resume instead.
+    """
+    stale = []
+    for table in tables:
+        key = MAPPINGS[table]["source"]
+        if not os.path.exists(source_path(FILES[key])):
+            continue   # skipped by the load anyway
+        cur.execute(f"SELECT source, rows_done FROM {CHECKPOINT_TABLE} WHERE table_name = %s", (table,))
+        found = cur.fetchall()
+        if found and found[0][1] and found[0][0] != source_signature(key, opts):
+            stale.append(table)
+    return stale
+
+def save_checkpoint(cur, table, signature, rows_done, complete=False):
+    sql = cur.backend.upsert_sql(CHECKPOINT_TABLE, ["table_name", "source", "rows_done", "complete"],
+                                 ["table_name"])
+    cur.execute(sql, (table, signature, rows_done, int(complete)))
+
+def slice_frames(frames, every, skip=0):
+    """Re-cut frames into slices of at most every rows (0 = as they come), minus the first skip rows."""
+    for df in frames:
+        if skip >= len(df):
+            skip -= len(df)
+            continue
+        df, skip = df.iloc[skip:], 0
+        if not every:
+            yield df
+            continue
+        for start in range(0, len(df), every):
+            yield df.iloc[start:start + every]
+
+# ======== MASTER TABLES ========
+# Only keys missing from meta's maps are sent, in one multi-row INSERT per
+# batch, and the new ids are read back with a keyed SELECT ... IN.
+def upsert_master(cur, meta, table, frame, batch_size=BATCH_SIZE):
+    """Insert the rows of frame whose key is not yet in meta's maps.
+
+    frame's columns are target column names, the first being the key the
+    table is unique on. Ids are not derived from LAST_INSERT_ID() ranges:
+    INSERT IGNORE skips rows and interleaved auto-increment locking does not
+    promise consecutive ids, so they are selected back by key instead.
+    Returns (new_ids, n_new, n_existing) with new_ids as key -> id.
+    """
+    cols = list(frame.columns)
+    key = cols[0]
+    keys = frame[key].astype(str).str.strip().str.upper()
+    frame = frame[frame[key].notna() & ~keys.duplicated()]
+    missing = frame[[not meta.known(table, key, k) for k in frame[key]]]
+    rows = list(missing.itertuples(index=False, name=None))
+    if meta.dry_run:
+        # nothing is written; id 0 stands in for the id the row would get, so
+        # facts referring to it count as resolved
+        meta.remember(table, [(dict(zip(cols, row)), 0) for row in rows])
+        return {}, len(rows), len(frame) - len(rows)
+
+    n_new = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        cur.execute(cur.backend.insert_sql(table, cols, len(batch), ignore=True),
+                    tuple(v for row in batch for v in row))
+        n_new += cur.rowcount
+
+    new_ids = {}
+    id_col, map_cols = meta.master_keys[table]
+    map_cols = list(dict.fromkeys(c for c in map_cols.values() if c))
+    if id_col and rows:
+        for start in range(0, len(rows), batch_size):
+            batch = [row[0] for row in rows[start:start + batch_size]]
+            cur.execute(f"SELECT {id_col}, {', '.join(map_cols)} FROM {table} "
+                        f"WHERE {key} IN ({', '.join(['%s'] * len(batch))})", tuple(batch))
+            found = [(dict(zip(map_cols, r[1:])), r[0]) for r in cur.fetchall()]
+            meta.remember(table, found)
+            new_ids.update((str(row[key]).strip().upper(), i) for row, i in found if row.get(key) is not None)
+    return new_ids, n_new, len(frame) - n_new
+
+def upsert_countries(cnx, cur, meta, introduction_df):
+    countries_cols = meta.columns("countries")
+    iso_col  = choose(countries_cols, "iso_code", "iso3", "code", "iso_3_code")
+    name_col = choose(countries_cols, "country_name", "name")
+    reg_col  = choose(countries_cols, "who_region", "region")
+
+    if not (iso_col and name_col):
+        print("❌ 'countries' table must have at least iso_code & country_name (or synonyms).")
         sys.exit(1)
 
-    cur = cnx.cursor()
+    # Source columns expected in introduction_df
+    src_iso  = "ISO_3_CODE" if "ISO_3_CODE" in introduction_df.columns else None
+    src_name = "COUNTRYNAME" if "COUNTRYNAME" in introduction_df.columns else None
+    src_reg  = "WHO_REGION" if "WHO_REGION" in introduction_df.columns else None
 
-    # Load files
-    coverage_df     = safe_read_excel(FILES["coverage"])
-    incidence_df    = safe_read_excel(FILES["incidence"])
-    reported_df     = safe_read_excel(FILES["reported"])
-    introduction_df = safe_read_excel(FILES["introduction"])
-    schedule_df     = safe_read_excel(FILES["schedule"])
+    if not (src_iso and src_name):
+        print("⚠️  Introduction file lacks ISO_3_CODE/COUNTRYNAME; skipping countries insert.")
+        return
+    ctry = pd.DataFrame({iso_col: str_col(introduction_df, src_iso),
+                         name_col: str_col(introduction_df, src_name)})
+    if src_reg and reg_col:
+        ctry[reg_col] = str_col(introduction_df, src_reg)
+    _, n_new, n_old = upsert_master(cur, meta, "countries", ctry)
+    cnx.commit()
+    print(f"✅ countries: {n_new} {'to add' if meta.dry_run else 'new'}, {n_old} already present")
 
-    # Trim/clean if loaded
-    for df in [coverage_df, incidence_df, reported_df, introduction_df, schedule_df]:
-        if df is None:
+def upsert_diseases(cnx, cur, meta, *dfs, verbose=True):
+    dis_cols = meta.columns("diseases")
+    # detect usable cols
+    dis_key = choose(dis_cols, "disease_code", "disease", "name")
+    dis_desc = choose(dis_cols, "disease_description", "description")
+    if not dis_key:
+        print("❌ 'diseases' table must have a name/code column (disease_code/disease/name).")
+        sys.exit(1)
+
+    frames = []
+    for df in dfs:
+        if df is None or "DISEASE" not in df.columns:
             continue
-        df.columns = df.columns.str.strip()
-        for c in df.select_dtypes(include=["object"]).columns:
-            df[c] = df[c].astype(str).str.strip()
-        df.drop_duplicates(inplace=True)
-
-    # ---- countries master ----
-    if introduction_df is not None:
-        countries_cols = get_table_columns(cur, "countries")
-        iso_col  = choose(countries_cols, "iso_code", "iso3", "code", "iso_3_code")
-        name_col = choose(countries_cols, "country_name", "name")
-        reg_col  = choose(countries_cols, "who_region", "region")
-
-        if not (iso_col and name_col):
-            print("❌ 'countries' table must have at least iso_code & country_name (or synonyms).")
-            sys.exit(1)
+        f = pd.DataFrame({dis_key: str_col(df, "DISEASE")})
+        if dis_desc:
+            f[dis_desc] = str_col(df, "DISEASE_DESCRIPTION")
+        frames.append(f.drop_duplicates())
+    if not frames:
+        return
+    _, n_new, n_old = upsert_master(cur, meta, "diseases", pd.concat(frames))
+    cnx.commit()
+    if verbose or n_new:
+        print(f"✅ diseases: {n_new} {'to add' if meta.dry_run else 'new'}, {n_old} already present")
 
-        # Source columns expected in introduction_df
-        src_iso  = "ISO_3_CODE" if "ISO_3_CODE" in introduction_df.columns else None
-        src_name = "COUNTRYNAME" if "COUNTRYNAME" in introduction_df.columns else None
-        src_reg  = "WHO_REGION" if "WHO_REGION" in introduction_df.columns else None
+def upsert_vaccines(cnx, cur, meta, *dfs, verbose=True):
+    vac_cols = meta.columns("vaccines")
+    vac_key = choose(vac_cols, "vaccine_code", "vaccine_name", "vaccine")
+    vac_desc = choose(vac_cols, "vaccine_description", "description")
+    if not vac_key:
+        print("❌ 'vaccines' table must have a name/code column (vaccine_code/vaccine_name/vaccine).")
+        sys.exit(1)
 
-        if not (src_iso and src_name):
-            print("⚠️  Introduction file lacks ISO_3_CODE/COUNTRYNAME; skipping countries insert.")
-        else:
-            ctry = introduction_df[[src_iso, src_name] + ([src_reg] if src_reg else [])].drop_duplicates()
-            print(f"✅ Upserting {len(ctry)} countries...")
-            placeholders = ", ".join(["%s"] * (2 + (1 if src_reg else 0)))
-            cols = [iso_col, name_col] + ([reg_col] if src_reg and reg_col else [])
-            sql = f"INSERT IGNORE INTO countries ({', '.join(cols)}) VALUES ({placeholders})"
-            for _, r in ctry.iterrows():
-                vals = [normalize_str(r[src_iso]), normalize_str(r[src_name])]
-                if src_reg and reg_col:
-                    vals.append(normalize_str(r[src_reg]))
-                cur.execute(sql, tuple(vals))
-            cnx.commit()
+    frames = []
+    for df in dfs:
+        if df is None or not {"ANTIGEN", "ANTIGEN_DESCRIPTION"} & set(df.columns):
+            continue
+        # prefer the code as key and the description as description, each
+        # falling back to the other
+        code = str_col(df, "ANTIGEN")
+        desc = str_col(df, "ANTIGEN_DESCRIPTION")
+        code, desc = code.where(code != "", None), desc.where(desc != "", None)
+        vdf = pd.DataFrame({vac_key: code.fillna(desc)})
+        if vac_desc:
+            vdf[vac_desc] = desc.fillna(code)
+        frames.append(vdf.drop_duplicates())
+    if not frames:
+        return
+    _, n_new, n_old = upsert_master(cur, meta, "vaccines", pd.concat(frames))
+    cnx.commit()
+    if verbose or n_new:
+        print(f"✅ vaccines: {n_new} {'to add' if meta.dry_run else 'new'}, {n_old} already present")
 
-    # ---- diseases master ----
-    if (incidence_df is not None) or (reported_df is not None):
-        dis_cols = get_table_columns(cur, "diseases")
-        # detect usable cols
-        dis_key = choose(dis_cols, "disease_code", "disease", "name")
-        dis_desc = choose(dis_cols, "disease_description", "description")
-        if not dis_key:
-            print("❌ 'diseases' table must have a name/code column (disease_code/disease/name).")
-            sys.exit(1)
+MASTERS_LOCK = threading.Lock()
 
-        frames = []
-        if incidence_df is not None:
-            cols = [c for c in ["DISEASE", "DISEASE_DESCRIPTION"] if c in incidence_df.columns]
-            if cols:
-                frames.append(incidence_df[cols].rename(columns={
-                    "DISEASE": "DISEASE",
-                    "DISEASE_DESCRIPTION": "DISEASE_DESCRIPTION"
-                }))
-        if reported_df is not None:
-            cols = [c for c in ["DISEASE", "DISEASE_DESCRIPTION"] if c in reported_df.columns]
-            if cols:
-                frames.append(reported_df[cols].rename(columns={
-                    "DISEASE": "DISEASE",
-                    "DISEASE_DESCRIPTION": "DISEASE_DESCRIPTION"
-                }))
-        if frames:
-            diseases_df = pd.concat(frames).drop_duplicates()
-            print(f"✅ Upserting {len(diseases_df)} diseases...")
-            # build insert
-            if dis_desc:
-                sql = f"INSERT IGNORE INTO diseases ({dis_key}, {dis_desc}) VALUES (%s, %s)"
-            else:
-                sql = f"INSERT IGNORE INTO diseases ({dis_key}) VALUES (%s)"
-            for _, r in diseases_df.iterrows():
-                key_val = normalize_str(r.get("DISEASE"))
-                desc_val = normalize_str(r.get("DISEASE_DESCRIPTION"))
-                if not key_val:
-                    continue
-                if dis_desc:
-                    cur.execute(sql, (key_val, desc_val))
-                else:
-                    cur.execute(sql, (key_val,))
-            cnx.commit()
+def with_masters(cnx, cur, frames, meta, upsert):
+    """--stream: add the master rows each chunk refers to before it is resolved.
 
-    # ---- vaccines master ----
-    if coverage_df is not None:
-        vac_cols = get_table_columns(cur, "vaccines")
-        vac_key = choose(vac_cols, "vaccine_code", "vaccine_name", "vaccine")
-        vac_desc = choose(vac_cols, "vaccine_description", "description")
-        if not vac_key:
-            print("❌ 'vaccines' table must have a name/code column (vaccine_code/vaccine_name/vaccine).")
-            sys.exit(1)
+    Loader threads share meta, so master inserts are serialized with a lock.
+    """
+    for df in frames:
+        with MASTERS_LOCK:
+            upsert(cnx, cur, meta, df, verbose=False)
+        yield df
 
-        needed = [c for c in ["ANTIGEN", "ANTIGEN_DESCRIPTION"] if c in coverage_df.columns]
-        if needed:
-            vdf = coverage_df[needed].drop_duplicates()
-            print(f"✅ Upserting {len(vdf)} vaccines...")
-            # pick best source for key
-            def pick_vac_key(row):
-                # prefer code if available
-                return normalize_str(row.get("ANTIGEN")) or normalize_str(row.get("ANTIGEN_DESCRIPTION"))
-            def pick_vac_desc(row):
-                return normalize_str(row.get("ANTIGEN_DESCRIPTION")) or normalize_str(row.get("ANTIGEN"))
-            if vac_desc:
-                sql = f"INSERT IGNORE INTO vaccines ({vac_key}, {vac_desc}) VALUES (%s, %s)"
+# ======== FACT MAPPINGS ========
+# How each fact table is filled from its cleaned workbook (a FILES key).
+# Every entry of "columns" maps one target column, given as candidate names
+# (the first one the table has wins, as with choose(); tables without any are
+# skipped), to either
+#   "from" + "as": a source column converted with CONVERTERS, or
+#   "lookup":      (id map, source column) pairs tried in order, e.g. the
+#                  vaccine code first and its description second.
+# "key" marks the natural key used by --incremental; "masters" names the
+# master table filled chunk by chunk with --stream. compile_mapping() turns a
+# spec into whole-column operations once per load, so adding a table or a
+# column is a matter of adding an entry here (and the workbook to FILES).
+MAPPINGS = {
+    "coverage_data": {
+        "source": "coverage",
+        "masters": "vaccines",
+        "columns": [
+            {"to": ["country_id"], "lookup": [("country", "CODE")], "key": True},
+            {"to": ["vaccine_id"], "lookup": [("vac_code", "ANTIGEN"), ("vac_name", "ANTIGEN_DESCRIPTION")],
+             "key": True},
+            {"to": ["year"], "from": "YEAR", "as": "int", "key": True},
+            {"to": ["coverage_category"], "from": "COVERAGE_CATEGORY", "as": "str", "key": True},
+            {"to": ["coverage_category_description"], "from": "COVERAGE_CATEGORY_DESCRIPTION", "as": "str"},
+            {"to": ["target_number"], "from": "TARGET_NUMBER", "as": "int"},
+            {"to": ["doses"], "from": "DOSES", "as": "int"},
+            {"to": ["coverage"], "from": "COVERAGE", "as": "dec"},
+        ],
+    },
+    "incidence_rate_data": {
+        "source": "incidence",
+        "masters": "diseases",
+        "columns": [
+            {"to": ["country_id"], "lookup": [("country", "CODE")], "key": True},
+            {"to": ["disease_id"], "lookup": [("dis_code", "DISEASE"), ("dis_name", "DISEASE")], "key": True},
+            {"to": ["year"], "from": "YEAR", "as": "int", "key": True},
+            {"to": ["denominator"], "from": "DENOMINATOR", "as": "str", "key": True},
+            {"to": ["incidence_rate"], "from": "INCIDENCE_RATE", "as": "dec"},
+        ],
+    },
+    "reported_cases_data": {
+        "source": "reported",
+        "masters": "diseases",
+        "columns": [
+            {"to": ["country_id"], "lookup": [("country", "CODE")], "key": True},
+            {"to": ["disease_id"], "lookup": [("dis_code", "DISEASE"), ("dis_name", "DISEASE")], "key": True},
+            {"to": ["year"], "from": "YEAR", "as": "int", "key": True},
+            {"to": ["cases", "reported_cases"], "from": "CASES", "as": "int"},
+        ],
+    },
+    "vaccine_schedule_data": {
+        "source": "schedule",
+        "columns": [
+            {"to": ["country_id"], "lookup": [("country", "ISO_3_CODE")], "key": True},
+            {"to": ["vaccine_id"], "lookup": [("vac_code", "VACCINECODE"), ("vac_name", "VACCINE_DESCRIPTION")],
+             "key": True},
+            {"to": ["year"], "from": "YEAR", "as": "int", "key": True},
+            {"to": ["schedulerounds"], "from": "SCHEDULEROUNDS", "as": "str", "key": True},
+            {"to": ["targetpop"], "from": "TARGETPOP", "as": "str", "key": True},
+            {"to": ["targetpop_description"], "from": "TARGETPOP_DESCRIPTION", "as": "str"},
+            {"to": ["geoarea", "geo_area", "geo"], "from": "GEOAREA", "as": "str", "key": True},
+            {"to": ["ageadministered", "age_administered", "age"], "from": "AGEADMINISTERED", "as": "str",
+             "key": True},
+            {"to": ["sourcecomment", "source_comment", "source"], "from": "SOURCECOMMENT", "as": "str"},
+        ],
+    },
+}
+
+CONVERTERS = {"str": str_col, "int": int_col, "dec": dec_col}
+
+def compile_mapping(table, meta):
+    """Compile MAPPINGS[table] against the table's columns: returns (cols, resolve, key_cols).
+
+    resolve(df) turns a cleaned frame into a fact frame (ids that do not
+    resolve are left missing, for validation to reject); key_cols is the
+    natural key used by --incremental.
+    """
+    have = meta.columns(table)
+    steps = [(choose(have, *col["to"]), col) for col in MAPPINGS[table]["columns"]]
+    steps = [(target, col) for target, col in steps if target]
+    cols = [target for target, _ in steps]
+    key_cols = [target for target, col in steps if col.get("key")]
+
+    def resolve(df):
+        values = {}
+        for target, col in steps:
+            if "lookup" in col:
+                # maps are read at call time: --stream adds master rows between chunks
+                ids = None
+                for map_name, src in col["lookup"]:
+                    found = key_col(df, src).map(meta.maps[map_name])
+                    ids = found if ids is None else ids.fillna(found)
+                values[target] = ids.astype("Int64")
             else:
-                sql = f"INSERT IGNORE INTO vaccines ({vac_key}) VALUES (%s)"
-            for _, r in vdf.iterrows():
-                key_val = pick_vac_key(r)
-                if not key_val:
-                    continue
-                if vac_desc:
-                    cur.execute(sql, (key_val, pick_vac_desc(r)))
-                else:
-                    cur.execute(sql, (key_val,))
-            cnx.commit()
+                values[target] = CONVERTERS[col["as"]](df, col["from"])
+        return fact_frame(values, cols)
 
-    # Refresh master maps
-    # countries
-    c_cols = get_table_columns(cur, "countries")
-    c_id = choose(c_cols, "country_id", "id")
-    c_iso = choose(c_cols, "iso_code", "iso3", "code", "iso_3_code")
-    if not (c_id and c_iso):
-        print("❌ countries table must have id & iso_code (or synonyms).")
-        sys.exit(1)
-    cur.execute(f"SELECT {c_id}, {c_iso} FROM countries")
-    country_map = {str(k).strip().upper(): i for i, k in cur.fetchall() if k is not None}
-
-    # vaccines
-    v_cols = get_table_columns(cur, "vaccines")
-    v_id = choose(v_cols, "vaccine_id", "id")
-    v_key_code = choose(v_cols, "vaccine_code")
-    v_key_name = choose(v_cols, "vaccine_name", "vaccine")
-    vac_code_map = {}
-    vac_name_map = {}
-    if v_id:
-        if v_key_code:
-            cur.execute(f"SELECT {v_id}, {v_key_code} FROM vaccines")
-            for i, k in cur.fetchall():
-                if k is not None:
-                    vac_code_map[str(k).strip().upper()] = i
-        if v_key_name:
-            cur.execute(f"SELECT {v_id}, {v_key_name} FROM vaccines")
-            for i, k in cur.fetchall():
-                if k is not None:
-                    vac_name_map[str(k).strip().upper()] = i
-
-    # diseases
-    d_cols = get_table_columns(cur, "diseases")
-    d_id = choose(d_cols, "disease_id", "id")
-    d_key_code = choose(d_cols, "disease_code")
-    d_key_name = choose(d_cols, "disease", "name")
-    dis_code_map = {}
-    dis_name_map = {}
-    if d_id:
-        if d_key_code:
-            cur.execute(f"SELECT {d_id}, {d_key_code} FROM diseases")
-            for i, k in cur.fetchall():
-                if k is not None:
-                    dis_code_map[str(k).strip().upper()] = i
-        if d_key_name:
-            cur.execute(f"SELECT {d_id}, {d_key_name} FROM diseases")
-            for i, k in cur.fetchall():
-                if k is not None:
-                    dis_name_map[str(k).strip().upper()] = i
+    return cols, resolve, key_cols
 
-    # ===== FACT INSERTS =====
+# ======== FACT LOADERS ========
+MASTER_UPSERTS = {"diseases": upsert_diseases, "vaccines": upsert_vaccines}
 
-    # ---- coverage_data ----
-    if coverage_df is not None and "coverage_data" in {t for t in ["coverage_data"]}:
-        cov_cols = get_table_columns(cur, "coverage_data")
-        f_id = choose(cov_cols, "id")
-        f_country = choose(cov_cols, "country_id")
-        f_vaccine = choose(cov_cols, "vaccine_id")
-        f_year = choose(cov_cols, "year")
-        f_covcat = choose(cov_cols, "coverage_category")
-        f_covcat_desc = choose(cov_cols, "coverage_category_description")
-        f_target = choose(cov_cols, "target_number")
-        f_doses = choose(cov_cols, "doses")
-        f_coverage = choose(cov_cols, "coverage")
-
-        cols = [f_country, f_vaccine, f_year, f_covcat, f_covcat_desc, f_target, f_doses, f_coverage]
-        cols = [c for c in cols if c]  # only existing cols
-        placeholders = ", ".join(["%s"] * len(cols))
-        sql_cov = f"INSERT INTO coverage_data ({', '.join(cols)}) VALUES ({placeholders})"
-
-        inserted, skipped = 0, 0
-        for _, r in coverage_df.iterrows():
-            iso = normalize_str(r.get("CODE"))
-            vac_code = normalize_str(r.get("ANTIGEN"))
-            vac_desc = normalize_str(r.get("ANTIGEN_DESCRIPTION"))
-
-            country_id = country_map.get((iso or "").upper())
-            vaccine_id = None
-            if vac_code:
-                vaccine_id = vac_code_map.get(vac_code.upper())
-            if not vaccine_id and vac_desc:
-                vaccine_id = vac_name_map.get(vac_desc.upper())
-
-            if not (country_id and vaccine_id):
-                skipped += 1
-                continue
+def load_table(cnx, cur, table, frames, meta, opts):
+    """Load one MAPPINGS table from its cleaned frames."""
+    spec = MAPPINGS[table]
+    cols, resolve, key_cols = compile_mapping(table, meta)
+    if opts.stream and spec.get("masters"):
+        frames = with_masters(cnx, cur, frames, meta, MASTER_UPSERTS[spec["masters"]])
+    return load_fact(cnx, cur, meta, table, cols, frames, resolve, opts, key_cols=key_cols, source=spec["source"])
 
-            vals = []
-            for c in cols:
-                if c == f_country:
-                    vals.append(country_id)
-                elif c == f_vaccine:
-                    vals.append(vaccine_id)
-                elif c == f_year:
-                    vals.append(to_int(r.get("YEAR")))
-                elif c == f_covcat:
-                    vals.append(normalize_str(r.get("COVERAGE_CATEGORY")))
-                elif c == f_covcat_desc:
-                    vals.append(normalize_str(r.get("COVERAGE_CATEGORY_DESCRIPTION")))
-                elif c == f_target:
-                    vals.append(to_int(r.get("TARGET_NUMBER")))
-                elif c == f_doses:
-                    vals.append(to_int(r.get("DOSES")))
-                elif c == f_coverage:
-                    vals.append(to_dec(r.get("COVERAGE")))
-            try:
-                cur.execute(sql_cov, tuple(vals))
-                inserted += 1
-            except Exception:
-                skipped += 1
-        cnx.commit()
-        print(f"✅ coverage_data: inserted {inserted}, skipped {skipped}")
-
-    # ---- incidence_rate_data ----
-    if incidence_df is not None:
-        inc_cols = get_table_columns(cur, "incidence_rate_data")
-        f_country = choose(inc_cols, "country_id")
-        f_disease = choose(inc_cols, "disease_id")
-        f_year = choose(inc_cols, "year")
-        f_denom = choose(inc_cols, "denominator")
-        f_rate = choose(inc_cols, "incidence_rate")
-
-        cols = [f_country, f_disease, f_year, f_denom, f_rate]
-        cols = [c for c in cols if c]
-        sql = f"INSERT INTO incidence_rate_data ({', '.join(cols)}) VALUES ({', '.join(['%s']*len(cols))})"
-
-        inserted, skipped = 0, 0
-        for _, r in incidence_df.iterrows():
-            iso = normalize_str(r.get("CODE"))
-            disease_code_or_name = normalize_str(r.get("DISEASE"))
-
-            country_id = country_map.get((iso or "").upper())
-            disease_id = dis_code_map.get((disease_code_or_name or "").upper()) \
-                         or dis_name_map.get((disease_code_or_name or "").upper())
-
-            if not (country_id and disease_id):
-                skipped += 1
-                continue
+def validate_table(cnx, cur, table, frames, meta, opts):
+    """--validate: resolve and check one MAPPINGS table, writing its rejects file but no rows."""
+    spec = MAPPINGS[table]
+    cols, resolve, _ = compile_mapping(table, meta)
+    if opts.stream and spec.get("masters"):
+        frames = with_masters(cnx, cur, frames, meta, MASTER_UPSERTS[spec["masters"]])
+    t0 = time.perf_counter()
+    print(f"⏳ {table}: validating...")
+    rejects = Rejects(table, opts.rejects_dir, opts.rejects_format)
+    n_source = n_valid = 0
+    try:
+        for df in frames:
+            n_source += len(df)
+            fact, reasons = validate(resolve(df), meta.tables.get(table, {}))
+            rejects.add(df, reasons)
+            n_valid += len(fact)
+    finally:
+        rejects.close()
+    profiler.count(rows=n_source)
+    print(f"✅ {table}: {n_valid} of {n_source} rows valid [{time.perf_counter() - t0:.1f}s]")
+    if rejects.count:
+        print(f"⚠️  {table}: {rejects.summary()}")
+    return {table: set()}
 
-            vals = []
-            for c in cols:
-                if c == f_country: vals.append(country_id)
-                elif c == f_disease: vals.append(disease_id)
-                elif c == f_year: vals.append(to_int(r.get("YEAR")))
-                elif c == f_denom: vals.append(normalize_str(r.get("DENOMINATOR")))
-                elif c == f_rate: vals.append(to_dec(r.get("INCIDENCE_RATE")))
-            try:
-                cur.execute(sql, tuple(vals))
-                inserted += 1
-            except Exception:
-                skipped += 1
-        cnx.commit()
-        print(f"✅ incidence_rate_data: inserted {inserted}, skipped {skipped}")
-
-        # ---- reported_cases_data ----
-    if reported_df is not None:
-        rep_cols = get_table_columns(cur, "reported_cases_data")
-        f_country = choose(rep_cols, "country_id")
-        f_disease = choose(rep_cols, "disease_id")
-        f_year = choose(rep_cols, "year")
-        f_cases = choose(rep_cols, "cases", "reported_cases")
-
-        cols = [f_country, f_disease, f_year, f_cases]
-        cols = [c for c in cols if c]
-        sql = f"INSERT INTO reported_cases_data ({', '.join(cols)}) VALUES ({', '.join(['%s']*len(cols))})"
-
-        inserted, skipped = 0, 0
-        for _, r in reported_df.iterrows():
-            iso = normalize_str(r.get("CODE"))
-            disease_name = normalize_str(r.get("DISEASE"))
-
-            country_id = country_map.get((iso or "").upper())
-            disease_id = dis_code_map.get((disease_name or "").upper()) \
-                         or dis_name_map.get((disease_name or "").upper())
-
-            # Skip rows where FK mismatch
-            if not (country_id and disease_id):
-                skipped += 1
-                continue
+def run_loader(pool, steps, meta, opts):
+    """Run fact loaders, one after another, on a connection borrowed from the pool.
+
+    steps is a list of (MAPPINGS table, frames) pairs. Returns the loaders'
+    merged {table: touched partitions}.
+    """
+    cnx = pool.get_connection()
+    cur = profiler.CountingCursor(cnx.cursor())
+    touched = {}
+    try:
+        step = validate_table if opts.validate else load_table
+        for table, frames in steps:
+            with profiler.stage(f"load:{MAPPINGS[table]['source']}"):
+                touched.update(step(cnx, cur, table, frames, meta, opts))
+        return touched
+    except Exception:
+        cnx.rollback()
+        raise
+    finally:
+        cur.close()
+        cnx.close()   # returns it to the pool
 
-            vals = []
-            for c in cols:
-                if c == f_country: 
-                    vals.append(country_id)
-                elif c == f_disease: 
-                    vals.append(disease_id)
-                elif c == f_year: 
-                    vals.append(to_int(r.get("YEAR")))
-                elif c == f_cases: 
-                    vals.append(to_int(r.get("CASES")))
+def read_all(keys, use_cache, jobs):
+    """Read the workbooks of the FILES keys, in separate processes when jobs > 1."""
+    if jobs <= 1 or len(keys) <= 1:
+        return [safe_read_excel(FILES[k], use_cache, SCHEMAS.get(k)) for k in keys]
+    with ProcessPoolExecutor(max_workers=min(jobs, len(keys))) as ex:
+        return list(ex.map(safe_read_excel, [FILES[k] for k in keys], [use_cache] * len(keys),
+                           [SCHEMAS.get(k) for k in keys]))
 
-            try:
-                cur.execute(sql, tuple(vals))
-                inserted += 1
-            except Exception as e:
-                print(f"❌ Skipped row {r.to_dict()} due to error: {e}")
-                skipped += 1
+# ======== MAIN ========
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Load the cleaned WHO vaccination workbooks into MySQL.")
+    ap.add_argument("--table", action="append", choices=list(MAPPINGS),
+                    help="load only this fact table (repeatable; default all); the master "
+                         "tables are still filled from the workbooks that are read")
+    ap.add_argument("--validate", action="store_true",
+                    help="dry run: check the fact rows and write the rejects files, "
+                         "without writing anything to the database")
+    ap.add_argument("--bulk", action="store_true",
+                    help="load fact tables with LOAD DATA LOCAL INFILE via a staging table "
+                         "(needs local_infile=ON on the server)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                    help=f"rows per multi-row INSERT (default {BATCH_SIZE})")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="always re-parse the workbooks instead of using the Parquet cache")
+    ap.add_argument("--jobs", type=int, default=JOBS,
+                    help=f"fact tables to load in parallel (default {JOBS}; 1 = sequential)")
+    ap.add_argument("--stream", action="store_true",
+                    help="read the fact workbooks in row chunks and load each chunk before "
+                         "reading the next, to bound memory")
+    ap.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS,
+                    help=f"rows per chunk with --stream (default {CHUNK_ROWS})")
+    ap.add_argument("--incremental", action="store_true",
+                    help="only insert fact rows that are new or changed since the last load, "
+                         "matched on each table's natural key")
+    ap.add_argument("--profile", metavar="PATH",
+                    help="write per-stage timings (wall time, rows/s, DB calls, bytes read, "
+                         "peak memory) to PATH and print a summary")
+    ap.add_argument("--profile-format", choices=["jsonl", "chrome"], default="jsonl",
+                    help="trace format for --profile: JSON lines, or Chrome trace for chrome://tracing")
+    ap.add_argument("--cprofile", metavar="STAGE", action="append", default=[],
+                    help="also run STAGE (e.g. read, masters, load:coverage) under cProfile and "
+                         "dump STAGE.prof next to the --profile trace; repeatable")
+    ap.add_argument("--checkpoint-every", type=int, default=0, metavar="N",
+                    help=f"commit each fact table every N source rows and record the progress in "
+                         f"{CHECKPOINT_TABLE}, so an interrupted load can be resumed")
+    ap.add_argument("--resume", action="store_true",
+                    help="skip the fact rows an interrupted checkpointed load already committed "
+                         f"(checkpoints every {CHECKPOINT_ROWS} rows unless --checkpoint-every is given)")
+    ap.add_argument("--reports", action="store_true",
+                    help="refresh the report_* summary tables for the (country, year) partitions "
+                         "this load wrote to")
+    ap.add_argument("--rebuild-reports", action="store_true",
+                    help="re-aggregate the report_* summary tables from all fact rows")
+    ap.add_argument("--rejects-dir", metavar="DIR",
+                    help=f"where <table>_rejects files of rows failing validation go "
+                         f"(default {REJECTS_DIR} in BASE_PATH)")
+    ap.add_argument("--rejects-format", choices=["csv", "parquet"], default="csv",
+                    help="format of the rejects files (default csv; --resume needs csv)")
+    ap.add_argument("--backend", choices=sorted(backends.BACKENDS), default=BACKEND,
+                    help=f"database to load into (default {BACKEND}); sqlite and duckdb write to "
+                         f"--db-file and create the tables if needed; duckdb has no transactions, "
+                         f"so no --incremental or checkpoints")
+    ap.add_argument("--async", dest="async_load", action="store_true",
+                    help="load the fact tables with aiomysql, pipelining batches from all tables "
+                         "over --jobs connections; each batch commits on its own (mysql only)")
+    ap.add_argument("--in-flight", type=int, default=IN_FLIGHT, metavar="N",
+                    help=f"with --async, resolved batches queued ahead of the connections (default {IN_FLIGHT})")
+    ap.add_argument("--db-file", metavar="PATH", default=os.environ.get("VACCINATION_DB_FILE"),
+                    help="database file for --backend sqlite/duckdb "
+                         "(default vaccination.<backend> in BASE_PATH)")
+    opts = ap.parse_args(argv)
+    opts.jobs = max(1, opts.jobs)
+    opts.table = list(dict.fromkeys(opts.table or MAPPINGS))
+    if opts.async_load:
+        clash = [flag for flag, on in [("--backend " + opts.backend, opts.backend != "mysql"),
+                                        ("--bulk", opts.bulk), ("--stream", opts.stream),
+                                        ("--incremental", opts.incremental),
+                                        ("--checkpoint-every/--resume", opts.checkpoint_every or opts.resume),
+                                        ("--validate", opts.validate)] if on]
+        if clash:
+            ap.error(f"--async cannot be combined with {', '.join(clash)}")
+    if opts.resume and opts.rejects_format != "csv":
+        # the rejects of the interrupted run would be overwritten
+        ap.error("--resume needs --rejects-format csv, so the rejects files can be appended to")
+    if opts.backend == "duckdb":
+        # DuckDB runs without transactions (see backends.py): a checkpoint or a
+        # delete-and-reinsert could be left half done
+        clash = [flag for flag, on in [("--incremental", opts.incremental),
+                                        ("--checkpoint-every/--resume", opts.checkpoint_every or opts.resume)] if on]
+        if clash:
+            ap.error(f"--backend duckdb cannot be combined with {', '.join(clash)}")
+    if not opts.rejects_dir:
+        opts.rejects_dir = os.path.join(BASE_PATH, REJECTS_DIR)
+    if opts.backend != "mysql" and not opts.db_file:
+        opts.db_file = os.path.join(BASE_PATH, f"vaccination.{opts.backend}")
+    return opts
 
-        cnx.commit()
-        print(f"✅ reported_cases_data: inserted {inserted}, skipped {skipped}")
-
-   
-
-    # ---- vaccine_schedule_data ----
-    if schedule_df is not None:
-        sch_cols = get_table_columns(cur, "vaccine_schedule_data")
-        f_country = choose(sch_cols, "country_id")
-        f_vaccine = choose(sch_cols, "vaccine_id")
-        f_year = choose(sch_cols, "year")
-        f_rounds = choose(sch_cols, "schedulerounds")
-        f_tpop = choose(sch_cols, "targetpop")
-        f_tpopd = choose(sch_cols, "targetpop_description")
-        f_geo = choose(sch_cols, "geoarea", "geo_area", "geo")
-        f_age = choose(sch_cols, "ageadministered", "age_administered", "age")
-        f_src = choose(sch_cols, "sourcecomment", "source_comment", "source")
-
-        cols = [c for c in [f_country, f_vaccine, f_year, f_rounds, f_tpop, f_tpopd, f_geo, f_age, f_src] if c]
-        sql = f"INSERT INTO vaccine_schedule_data ({', '.join(cols)}) VALUES ({', '.join(['%s']*len(cols))})"
-
-        inserted, skipped = 0, 0
-        for _, r in schedule_df.iterrows():
-            iso = normalize_str(r.get("ISO_3_CODE"))
-            country_id = country_map.get((iso or "").upper())
-
-            # vaccine via code first, else by description
-            vcode = normalize_str(r.get("VACCINECODE"))
-            vdesc = normalize_str(r.get("VACCINE_DESCRIPTION"))
-            vaccine_id = None
-            if vcode:
-                vaccine_id = vac_code_map.get(vcode.upper())
-            if not vaccine_id and vdesc:
-                vaccine_id = vac_name_map.get(vdesc.upper())
-
-            if not (country_id and vaccine_id):
-                skipped += 1
-                continue
+def main(argv=None):
+    opts = parse_args(argv)
+    # STAGE.prof files go next to the --profile trace, or in the working directory
+    prof_dir = os.path.dirname(os.path.abspath(opts.profile)) if opts.profile else os.getcwd()
+    profiler.configure(opts.cprofile, prof_dir)
 
-            vals = []
-            for c in cols:
-                if c == f_country: vals.append(country_id)
-                elif c == f_vaccine: vals.append(vaccine_id)
-                elif c == f_year: vals.append(to_int(r.get("YEAR")))
-                elif c == f_rounds: vals.append(normalize_str(r.get("SCHEDULEROUNDS")))
-                elif c == f_tpop: vals.append(normalize_str(r.get("TARGETPOP")))
-                elif c == f_tpopd: vals.append(normalize_str(r.get("TARGETPOP_DESCRIPTION")))
-                elif c == f_geo: vals.append(normalize_str(r.get("GEOAREA")))
-                elif c == f_age: vals.append(normalize_str(r.get("AGEADMINISTERED")))
-                elif c == f_src: vals.append(normalize_str(r.get("SOURCECOMMENT")))
-            try:
-                cur.execute(sql, tuple(vals))
-                inserted += 1
-            except Exception:
-                skipped += 1
+    # connect db (one connection for the masters plus one per fact loader)
+    db_file = opts.db_file
+    if opts.validate and opts.backend != "mysql" and not os.path.exists(db_file):
+        db_file = ":memory:"   # a dry run does not create the database file
+    backend = backends.make(opts.backend, DB, db_file, allow_local_infile=opts.bulk)
+    try:
+        with profiler.stage("connect"):
+            pool = backend.pool(min(opts.jobs, 4) + 1)
+            cnx = pool.get_connection()
+    except backend.Error as err:
+        print("❌ DB connection failed:", err)
+        sys.exit(1)
+
+    cur = profiler.CountingCursor(cnx.cursor())
+    if not opts.validate:
+        backend.create_schema(cur)
+        if opts.incremental:
+            create_fingerprint_table(cur)
+        if opts.checkpoint_every or opts.resume:
+            create_checkpoint_table(cur)
         cnx.commit()
-        print(f"✅ vaccine_schedule_data: inserted {inserted}, skipped {skipped}")
+        stale = stale_checkpoints(cur, opts.table, opts) if opts.resume else []
+        if stale:
+            print(f"❌ The source of {', '.join(stale)} changed since the interrupted load committed part of it, "
+                  f"so --resume would load those rows twice. Delete the table's rows and its {CHECKPOINT_TABLE} "
+                  f"entry, then load again.")
+            sys.exit(1)
+
+    # Load files: the introduction sheet (for the countries) and the
+    # workbooks of the tables being loaded
+    fact_keys = list(dict.fromkeys(MAPPINGS[t]["source"] for t in opts.table))
+    use_cache = not opts.no_cache
+    with profiler.stage("read"):
+        if opts.stream:
+            # only the small introduction sheet is read whole; the fact sheets are
+            # iterated chunk by chunk by their loaders (and timed there)
+            read = {"introduction": safe_read_excel(FILES["introduction"], use_cache, SCHEMAS["introduction"])}
+            facts = {k: safe_stream_excel(FILES[k], opts.chunk_rows, SCHEMAS.get(k)) for k in fact_keys}
+        else:
+            keys = ["introduction"] + fact_keys
+            read = dict(zip(keys, read_all(keys, use_cache, opts.jobs)))
+            facts = {k: read[k] for k in fact_keys}
+        for k, df in read.items():
+            if df is not None:
+                profiler.count(rows=len(df), bytes_read=os.path.getsize(source_path(FILES[k])))
+    introduction_df = read["introduction"]
+
+    # Trim/clean if loaded
+    with profiler.stage("clean"):
+        if introduction_df is not None:
+            profiler.count(rows=len(clean_frame(introduction_df)))
+        sources = {}
+        for k, df in facts.items():
+            if df is None:
+                continue
+            if opts.stream:
+                # duplicates are dropped within each chunk; the cleaned_ inputs
+                # are already de-duplicated by clean_excel.py
+                sources[k] = (clean_frame(chunk) for chunk in df)
+            else:
+                sources[k] = [clean_frame(df)]
+                profiler.count(rows=len(df))
 
+    # ---- masters ----
+    with profiler.stage("masters"):
+        meta = Metadata(cur, dry_run=opts.validate)
+        meta.load_maps(cur)
+        if opts.incremental and not opts.validate:
+            create_key_indexes(cur, meta, opts.table)
+            cnx.commit()
+        if introduction_df is not None:
+            upsert_countries(cnx, cur, meta, introduction_df)
+        if not opts.stream:
+            # with --stream these are filled chunk by chunk as the facts load
+            for name, upsert in MASTER_UPSERTS.items():
+                dfs = [sources[spec["source"]][0] for spec in MAPPINGS.values()
+                       if spec.get("masters") == name and spec["source"] in sources]
+                if dfs:
+                    upsert(cnx, cur, meta, *dfs)
     cur.close()
     cnx.close()
+
+    # ===== FACT INSERTS =====
+    # The fact tables only depend on the id maps, so each one loads on its
+    # own pooled connection and commits its own transaction.
+    steps = {table: (table, sources[spec["source"]]) for table, spec in MAPPINGS.items()
+             if table in opts.table and spec["source"] in sources}
+    groups = []
+    if opts.stream and "coverage_data" in steps and "vaccine_schedule_data" in steps:
+        # schedule rows resolve against the vaccines coverage adds while it streams
+        groups.append([steps.pop("coverage_data"), steps.pop("vaccine_schedule_data")])
+    groups += [[step] for step in steps.values()]
+    touched = {}
+    with profiler.stage("facts"):
+        if opts.async_load:
+            import async_load   # needs aiomysql
+            tables = [(table, *compile_mapping(table, meta)[:2], frames) for table, frames in steps.values()]
+            touched = async_load.load_facts(backend, meta, tables, opts)
+        else:
+            # SQLite has one writer at a time: a second loader would wait on the
+            # first one's transaction (and, with --stream, deadlock on the masters)
+            with ThreadPoolExecutor(max_workers=opts.jobs if backend.parallel_writes else 1) as ex:
+                futures = [ex.submit(run_loader, pool, steps, meta, opts) for steps in groups]
+                for f in as_completed(futures):
+                    touched.update(f.result())
+
+    # ===== REPORTS =====
+    if (opts.reports or opts.rebuild_reports) and not opts.validate:
+        with profiler.stage("reports"):
+            cnx = pool.get_connection()
+            cur = profiler.CountingCursor(cnx.cursor())
+            try:
+                refresh_reports(cnx, cur, meta, touched, rebuild=opts.rebuild_reports)
+            finally:
+                cur.close()
+                cnx.close()
+
+    if opts.profile:
+        profiler.print_summary()
+        profiler.write_trace(opts.profile, opts.profile_format)
+        print(f"💾 Profile written to {opts.profile}")
+
     print("\n🎉 Done. If any rows were skipped, the counts above tell you where and why (usually missing FK matches).")
 
 if __name__ == "__main__":
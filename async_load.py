@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import profiler
+from validation import Rejects, db_rejects, frame_rows, validate
+
+# --async fact loading for a.py: the MAPPINGS tables are resolved exactly
+# as the threaded loaders do, cut into --batch-size batches, and written by a
+# fixed set of aiomysql connections pulling from one bounded queue. While one
+# connection waits on the server the others keep sending, so network latency
+# overlaps instead of adding up; the queue bound (--in-flight) keeps the
+# resolved batches in memory to a few.
+#
+# a.py compiles the mappings and passes them in. This module does not import
+# a.py: run as `python a.py`, that would execute it a second time as `a`.
+#
+# Each batch is committed on its own, so unlike the threaded loaders a failed
+# run leaves the batches already written in place. To try it against a local
+# MariaDB/MySQL, point a.DB at it and run `python a.py --async`.
+
+def connect_args(db):
+    """a.py's DB (mysql.connector keywords) as aiomysql keywords."""
+    args = dict(db)
+    if "database" in args:
+        args["db"] = args.pop("database")
+    return args
+
+class TableStats:
+    def __init__(self, cols, types, rejects):
+        self.cols = cols
+        self.types = types      # Metadata column types, for validation
+        self.rejects = rejects
+        self.source = 0
+        self.inserted = 0
+        self.pending = 1        # batches queued or being written, plus the end marker
+        self.touched = set()
+        self.t0 = time.perf_counter()
+        self.took = 0.0
+
+async def insert_chunk(cnx, cur, sql, rows):
+    """a._insert_chunk for one aiomysql connection; commits what goes in."""
+    try:
+        await cur.executemany(sql, rows)
+        await cnx.commit()
+        return len(rows), []
+    except Exception as e:
+        await cnx.rollback()
+        if len(rows) == 1:
+            return 0, [(rows[0], e)]
+        mid = len(rows) // 2
+        n1, bad1 = await insert_chunk(cnx, cur, sql, rows[:mid])
+        n2, bad2 = await insert_chunk(cnx, cur, sql, rows[mid:])
+        return n1 + n2, bad1 + bad2
+
+def prepare(stats, resolve, df):
+    """Resolve and validate one frame; returns the fact frame and its insert tuples."""
+    fact, reasons = validate(resolve(df), stats.types)
+    stats.rejects.add(df, reasons)
+    return fact, frame_rows(fact)
+
+async def produce(queue, stats, table, sql, resolve, frames, batch_size):
+    """Resolve one table's frames off the event loop and queue its batches."""
+    part = [c for c in ("country_id", "year") if c in stats.cols]
+    print(f"⏳ {table}: loading...")
+    for df in frames:
+        stats.source += len(df)
+        fact, rows = await asyncio.to_thread(prepare, stats, resolve, df)
+        if len(part) == 2:
+            stats.touched.update(fact[part].dropna().drop_duplicates().itertuples(index=False, name=None))
+        for start in range(0, len(rows), batch_size):
+            stats.pending += 1
+            # the frames travel with the batch so refused rows can be traced to the source
+            await queue.put((table, sql, rows[start:start + batch_size], fact, df))
+    await queue.put((table, None, None, None, None))
+
+async def write(pool, queue, stats):
+    """Take batches off the queue until a None arrives, on one pooled connection."""
+    async with pool.acquire() as cnx:
+        async with cnx.cursor() as cur:
+            while (item := await queue.get()) is not None:
+                table, sql, rows, fact, df = item
+                s = stats[table]
+                if rows is not None:
+                    n, bad = await insert_chunk(cnx, cur, sql, rows)
+                    s.inserted += n
+                    if bad:
+                        s.rejects.add(df, db_rejects(fact, bad))
+                s.pending -= 1
+                if s.pending == 0:
+                    report(table, s)
+
+def report(table, s):
+    s.took = time.perf_counter() - s.t0
+    s.rejects.close()
+    print(f"✅ {table}: inserted {s.inserted}, skipped {s.source - s.inserted} [{s.took:.1f}s]")
+    if s.rejects.count:
+        print(f"⚠️  {table}: {s.rejects.summary()}")
+
+async def load(backend, meta, tables, opts):
+    import aiomysql
+    pool = await aiomysql.create_pool(minsize=1, maxsize=opts.jobs, autocommit=False,
+                                      **connect_args(backend.db))
+    try:
+        queue = asyncio.Queue(maxsize=max(1, opts.in_flight))
+        stats, producers = {}, []
+        for table, cols, resolve, frames in tables:
+            rejects = Rejects(table, opts.rejects_dir, opts.rejects_format)
+            stats[table] = TableStats(cols, meta.tables.get(table, {}), rejects)
+            producers.append(produce(queue, stats[table], table, backend.insert_sql(table, cols), resolve,
+                                     frames, opts.batch_size))
+        writers = [asyncio.create_task(write(pool, queue, stats)) for _ in range(opts.jobs)]
+
+        async def feed():
+            await asyncio.gather(*producers)
+            for _ in writers:
+                await queue.put(None)
+
+        tasks = [asyncio.create_task(feed())] + writers
+        try:
+            # a writer that fails (e.g. lost connection) ends the load at once
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            for s in stats.values():
+                s.rejects.close()
+    finally:
+        pool.close()
+        await pool.wait_closed()
+    profiler.count(rows=sum(s.source for s in stats.values()))
+    return {table: s.touched for table, s in stats.items()}
+
+def load_facts(backend, meta, tables, opts):
+    """Load the cleaned fact frames over opts.jobs aiomysql connections.
+
+    tables holds (table, cols, resolve, frames) for each fact table, with
+    cols and resolve from a.compile_mapping() and frames the cleaned frames.
+    Returns {table: (country_id, year) pairs written}, for refresh_reports.
+    """
+    return asyncio.run(load(backend, meta, tables, opts))
@@ -0,0 +1,419 @@
+import os
+import re
+import tempfile
+import threading
+
+# Database backends for a.py. a.py writes its SQL in MySQL's dialect with %s
+# placeholders; each backend hands out connections whose cursors translate the
+# placeholders, and supplies the parts that differ between engines: column
+# introspection, INSERT IGNORE / upsert syntax, bulk inserts and the schema
+# for the embedded targets. Cursors carry their backend as cur.backend.
+
+# Tables created in an embedded database that does not have them yet; {id} is
+# the backend's auto-increment primary key. MySQL schemas are managed by hand.
+SCHEMA = {
+    "countries": "{id}, iso_code VARCHAR(3) UNIQUE, country_name VARCHAR(100), who_region VARCHAR(10)",
+    "vaccines": "{id}, vaccine_code VARCHAR(50) UNIQUE, vaccine_description VARCHAR(255)",
+    "diseases": "{id}, disease_code VARCHAR(50) UNIQUE, disease_description VARCHAR(255)",
+    "coverage_data": "{id}, country_id INT REFERENCES countries(id), vaccine_id INT REFERENCES vaccines(id), "
+                     "year INT, coverage_category VARCHAR(50), coverage_category_description VARCHAR(255), "
+                     "target_number BIGINT, doses BIGINT, coverage DECIMAL(10,2)",
+    "incidence_rate_data": "{id}, country_id INT REFERENCES countries(id), disease_id INT REFERENCES diseases(id), "
+                           "year INT, denominator VARCHAR(100), incidence_rate DECIMAL(12,3)",
+    "reported_cases_data": "{id}, country_id INT REFERENCES countries(id), disease_id INT REFERENCES diseases(id), "
+                           "year INT, cases INT",
+    "vaccine_schedule_data": "{id}, country_id INT REFERENCES countries(id), vaccine_id INT REFERENCES vaccines(id), "
+                             "year INT, schedulerounds VARCHAR(20), targetpop VARCHAR(20), "
+                             "targetpop_description VARCHAR(255), geoarea VARCHAR(50), "
+                             "ageadministered VARCHAR(50), sourcecomment TEXT",
+}
+
+def schema_columns():
+    """(table, column, data type, max length) for the SCHEMA tables, as Backend.columns() reads them."""
+    rows = []
+    for table, cols in SCHEMA.items():
+        for col in cols.format(id="id INTEGER").split(", "):
+            name, decl = col.split()[:2]
+            m = re.match(r"(\w+)(?:\((\d+))?", decl)
+            rows.append((table, name, m.group(1).lower(), int(m.group(2)) if m.group(2) else None))
+    return rows
+
+class Cursor:
+    """DB-API cursor wrapper that rewrites %s placeholders for the backend."""
+
+    def __init__(self, cur, backend):
+        self._cur = cur
+        self.backend = backend
+        self.rowcount = -1
+
+    def execute(self, sql, params=()):
+        self._cur.execute(self.backend.translate(sql), tuple(params))
+        self.rowcount = self._cur.rowcount
+
+    def executemany(self, sql, rows):
+        self._cur.executemany(self.backend.translate(sql), rows)
+        self.rowcount = self._cur.rowcount
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+    def close(self):
+        self._cur.close()
+
+class Connection:
+    def __init__(self, cnx, backend):
+        self._cnx = cnx
+        self.backend = backend
+
+    def cursor(self):
+        return Cursor(self._cnx.cursor(), self.backend)
+
+    def commit(self):
+        self._cnx.commit()
+
+    def rollback(self):
+        self._cnx.rollback()
+
+    def close(self):
+        self._cnx.close()
+
+class Backend:
+    """Interface a.py loads through; subclasses fill in the engine specifics."""
+    name = None
+    columnar = False        # insert_frame() takes whole DataFrames
+    parallel_writes = True  # several connections can hold write transactions at once
+    null_safe_eq = "<=>"
+    Error = Exception       # the driver's base exception
+
+    def pool(self, size):
+        """Return an object whose get_connection() hands out a Connection."""
+        raise NotImplementedError
+
+    def translate(self, sql):
+        return sql
+
+    def columns(self, cur):
+        """(table, column, data type, max length) for every column in the database."""
+        raise NotImplementedError
+
+    def indexes(self, cur):
+        """(table, index name) for every secondary index in the database."""
+        raise NotImplementedError
+
+    def create_schema(self, cur):
+        """Create the SCHEMA tables that are missing (embedded backends only)."""
+
+    def planned_columns(self):
+        """columns() rows of the tables create_schema() would create."""
+        return []
+
+    def insert_sql(self, table, cols, n_rows=1, ignore=False):
+        verb = "INSERT IGNORE" if ignore else "INSERT"
+        row = "(" + ", ".join(["%s"] * len(cols)) + ")"
+        return f"{verb} INTO {table} ({', '.join(cols)}) VALUES {', '.join([row] * n_rows)}"
+
+    def upsert_sql(self, table, cols, key_cols):
+        """INSERT that overwrites the non-key columns of an existing key_cols row."""
+        update = ", ".join(f"{c} = VALUES({c})" for c in cols if c not in key_cols)
+        return f"{self.insert_sql(table, cols)} ON DUPLICATE KEY UPDATE {update}"
+
+    def fetch_keys(self, cur, table, id_col, key_cols):
+        """Read id_col and key_cols of every row, as (id, {column: value}) pairs."""
+        cur.execute(f"SELECT {id_col}, {', '.join(key_cols)} FROM {table}")
+        return [(row[0], dict(zip(key_cols, row[1:]))) for row in cur.fetchall()]
+
+    def bulk_insert(self, cur, table, cols, rows):
+        """Insert rows in one go, silently dropping duplicates; returns rows inserted."""
+        cur.executemany(self.insert_sql(table, cols, ignore=True), rows)
+        return cur.rowcount
+
+    def insert_frame(self, cur, table, cols, frame):
+        raise NotImplementedError
+
+# ======== MYSQL ========
+def tsv_field(v):
+    """Encode one value for LOAD DATA's default FIELDS/LINES/ESCAPED BY format."""
+    if v is None:
+        return "\\N"
+    return (str(v).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+class MySQLBackend(Backend):
+    name = "mysql"
+
+    def __init__(self, db, allow_local_infile=False):
+        import mysql.connector
+        self.Error = mysql.connector.Error
+        self.db = db
+        self.allow_local_infile = allow_local_infile
+
+    def pool(self, size):
+        from mysql.connector import pooling
+        raw = pooling.MySQLConnectionPool(pool_name="vaccination", pool_size=size,
+                                          allow_local_infile=self.allow_local_infile, **self.db)
+        backend = self
+
+        class Pool:
+            def get_connection(self):
+                return Connection(raw.get_connection(), backend)
+        return Pool()
+
+    def columns(self, cur):
+        cur.execute("""
+            SELECT TABLE_NAME, COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+        """)
+        return cur.fetchall()
+
+    def indexes(self, cur):
+        cur.execute("""
+            SELECT TABLE_NAME, INDEX_NAME FROM INFORMATION_SCHEMA.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE()
+        """)
+        return cur.fetchall()
+
+    def bulk_insert(self, cur, table, cols, rows):
+        """Load rows through a temp TSV, LOAD DATA LOCAL INFILE and a staging table.
+
+        The staging table is a TEMPORARY copy of the target's definition (foreign
+        keys are not copied), so the file loads without checks. LOAD DATA LOCAL
+        turns conversion errors into warnings and stores clipped values, so any
+        warning fails the load before the final plain INSERT ... SELECT. That
+        INSERT fails as a whole on an FK or unique violation. Either way the
+        caller falls back to batched inserts, which pick out the bad rows.
+        Returns the number of rows inserted.
+        """
+        stage = f"_stage_{table}"
+        col_list = ", ".join(cols)
+        cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {stage}")
+        cur.execute(f"CREATE TEMPORARY TABLE {stage} LIKE {table}")
+        fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=".tsv")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as fh:
+                for row in rows:
+                    fh.write("\t".join(tsv_field(v) for v in row) + "\n")
+            cur.execute(f"LOAD DATA LOCAL INFILE %s INTO TABLE {stage} CHARACTER SET utf8mb4 ({col_list})",
+                        (path.replace("\\", "/"),))
+            cur.execute("SHOW WARNINGS LIMIT 1")
+            warning = cur.fetchall()
+            if warning:
+                raise self.Error(msg=f"LOAD DATA changed or dropped values: {warning[0][2]}")
+            cur.execute(f"INSERT INTO {table} ({col_list}) SELECT {col_list} FROM {stage}")
+            return cur.rowcount
+        finally:
+            os.remove(path)
+            cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {stage}")
+
+# ======== SQLITE ========
+class SQLiteCursor(Cursor):
+    def executemany(self, sql, rows):
+        # a failing executemany must leave nothing behind, like MySQL's
+        # multi-row INSERT, so batches can be bisected
+        cnx = self._cur.connection
+        if not cnx.in_transaction:
+            cnx.execute("BEGIN IMMEDIATE")
+        cnx.execute("SAVEPOINT batch")
+        try:
+            super().executemany(sql, rows)
+        except self.backend.Error:
+            cnx.execute("ROLLBACK TO batch")
+            raise
+        finally:
+            cnx.execute("RELEASE batch")
+
+class SQLiteBackend(Backend):
+    name = "sqlite"
+    null_safe_eq = "IS"
+    parallel_writes = False
+
+    def __init__(self, path):
+        import sqlite3
+        self.sqlite3 = sqlite3
+        self.Error = sqlite3.Error
+        self.path = path
+
+    def pool(self, size):
+        backend = self
+
+        class Pool:
+            def get_connection(self):
+                # writes take the database lock when their transaction starts: a
+                # deferred transaction that reads first and then writes is refused
+                # outright ("database is locked") while another connection writes
+                cnx = backend.sqlite3.connect(backend.path, timeout=60, check_same_thread=False,
+                                              isolation_level="IMMEDIATE")
+                cnx.execute("PRAGMA foreign_keys = ON")
+                return SQLiteConnection(cnx, backend)
+        return Pool()
+
+    def translate(self, sql):
+        return sql.replace("%s", "?")
+
+    def columns(self, cur):
+        cur.execute("""
+            SELECT m.name, p.name, p.type FROM sqlite_master m, pragma_table_info(m.name) p
+            WHERE m.type = 'table'
+        """)
+        rows = []
+        for table, col, decl in cur.fetchall():
+            m = re.match(r"\s*(\w+)\s*(?:\(\s*(\d+))?", decl or "")
+            rows.append((table, col, m.group(1).lower() if m else "", int(m.group(2)) if m and m.group(2) else None))
+        return rows
+
+    def indexes(self, cur):
+        cur.execute("""
+            SELECT m.name, i.name FROM sqlite_master m, pragma_index_list(m.name) i
+            WHERE m.type = 'table'
+        """)
+        return cur.fetchall()
+
+    def create_schema(self, cur):
+        for table, cols in SCHEMA.items():
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols.format(id='id INTEGER PRIMARY KEY')})")
+
+    def planned_columns(self):
+        return schema_columns()
+
+    def insert_sql(self, table, cols, n_rows=1, ignore=False):
+        sql = super().insert_sql(table, cols, n_rows)
+        return sql.replace("INSERT", "INSERT OR IGNORE", 1) if ignore else sql
+
+    def upsert_sql(self, table, cols, key_cols):
+        update = ", ".join(f"{c} = excluded.{c}" for c in cols if c not in key_cols)
+        return f"{self.insert_sql(table, cols)} ON CONFLICT ({', '.join(key_cols)}) DO UPDATE SET {update}"
+
+class SQLiteConnection(Connection):
+    def cursor(self):
+        return SQLiteCursor(self._cnx.cursor(), self.backend)
+
+# ======== DUCKDB ========
+# DuckDB runs in autocommit mode: a failed statement inside an explicit
+# transaction aborts the whole transaction, which would defeat the batch
+# bisection in a.py, so commit()/rollback() are no-ops and every statement is
+# atomic on its own. A failed load therefore keeps what it wrote, and a.py
+# refuses --incremental and --checkpoint-every/--resume here, which rely on
+# several statements committing together. Fact frames go in through Arrow
+# with one INSERT ... SELECT instead of row by row.
+class DuckDBCursor(Cursor):
+    def execute(self, sql, params=()):
+        self._cur.execute(self.backend.translate(sql), tuple(params))
+        self.rowcount = self._count(sql)
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        m = re.match(r"(?is)\s*(INSERT\b.*\bVALUES\s*)(\(.*\))\s*$", sql)
+        if m and rows:
+            # one multi-row statement, so the batch succeeds or fails as a whole
+            self.execute(m.group(1) + ", ".join([m.group(2)] * len(rows)), [v for row in rows for v in row])
+            return
+        total = 0
+        for row in rows:
+            self.execute(sql, row)
+            total += max(self.rowcount, 0)
+        self.rowcount = total
+
+    def register(self, name, data):
+        self._cur.register(name, data)
+
+    def unregister(self, name):
+        self._cur.unregister(name)
+
+    def _count(self, sql):
+        """DuckDB returns the affected row count as a result row, not as rowcount."""
+        if re.match(r"(?is)\s*(INSERT|UPDATE|DELETE)\b", sql):
+            found = self._cur.fetchall()
+            return found[0][0] if found else 0
+        return -1
+
+class DuckDBConnection(Connection):
+    def cursor(self):
+        return DuckDBCursor(self._cnx.cursor(), self.backend)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+class DuckDBBackend(Backend):
+    name = "duckdb"
+    columnar = True
+    null_safe_eq = "IS NOT DISTINCT FROM"
+
+    def __init__(self, path):
+        import duckdb
+        self.duckdb = duckdb
+        self.Error = duckdb.Error
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def pool(self, size):
+        backend = self
+
+        class Pool:
+            def get_connection(self):
+                # one database handle per process; each pooled connection is
+                # a cursor on it, which DuckDB makes safe to use per thread
+                with backend._lock:
+                    if backend._db is None:
+                        backend._db = backend.duckdb.connect(backend.path)
+                    return DuckDBConnection(backend._db.cursor(), backend)
+        return Pool()
+
+    def translate(self, sql):
+        return sql.replace("%s", "?")
+
+    def columns(self, cur):
+        cur.execute("""
+            SELECT table_name, column_name, lower(data_type), character_maximum_length
+            FROM information_schema.columns
+            WHERE table_schema = current_schema()
+        """)
+        return cur.fetchall()
+
+    def indexes(self, cur):
+        cur.execute("SELECT table_name, index_name FROM duckdb_indexes()")
+        return cur.fetchall()
+
+    def create_schema(self, cur):
+        for table, cols in SCHEMA.items():
+            cur.execute(f"CREATE SEQUENCE IF NOT EXISTS seq_{table}")
+            pk = f"id INTEGER PRIMARY KEY DEFAULT nextval('seq_{table}')"
+            cur.execute(f"CREATE TABLE IF NOT EXISTS {table} ({cols.format(id=pk)})")
+
+    def planned_columns(self):
+        return schema_columns()
+
+    def insert_sql(self, table, cols, n_rows=1, ignore=False):
+        sql = super().insert_sql(table, cols, n_rows)
+        return sql.replace("INSERT", "INSERT OR IGNORE", 1) if ignore else sql
+
+    def upsert_sql(self, table, cols, key_cols):
+        update = ", ".join(f"{c} = excluded.{c}" for c in cols if c not in key_cols)
+        return f"{self.insert_sql(table, cols)} ON CONFLICT ({', '.join(key_cols)}) DO UPDATE SET {update}"
+
+    def bulk_insert(self, cur, table, cols, rows):
+        import pandas as pd
+        return self.insert_frame(cur, table, cols, pd.DataFrame(rows, columns=cols))
+
+    def insert_frame(self, cur, table, cols, frame):
+        """INSERT OR IGNORE the frame's cols through an Arrow view; returns rows inserted."""
+        import pyarrow as pa
+        view = f"_frame_{table}"
+        cur.register(view, pa.Table.from_pandas(frame[cols], preserve_index=False))
+        try:
+            cur.execute(f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) "
+                        f"SELECT {', '.join(cols)} FROM {view}")
+            return cur.rowcount
+        finally:
+            cur.unregister(view)
+
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend, "duckdb": DuckDBBackend}
+
+def make(name, db=None, path=None, allow_local_infile=False):
+    """Backend by name: MySQL with the db connection settings, or an embedded file at path."""
+    if name == "mysql":
+        return MySQLBackend(db, allow_local_infile)
+    return BACKENDS[name](path)
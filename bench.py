@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+import a
+import backends
+
+# ======== CONFIG ========
+SCALES = [10_000, 100_000]      # coverage rows per run (10k .. 10M)
+EXCEL_MAX_ROWS = 1_048_575      # data rows that fit in one .xlsx sheet
+N_COUNTRIES = 200
+YEARS = list(range(1980, 2024))
+ANTIGENS = ["BCG", "DTPCV1", "DTPCV3", "HEPB3", "HEPBB", "HIBCV3", "IPV1", "MCV1", "MCV2",
+            "PCV3", "POL3", "RCV1", "ROTAC", "YFV", "MENGA", "JAPENC", "TYPHOID", "HPVC"]
+COVERAGE_CATEGORIES = ["ADMIN", "OFFICIAL", "WUENIC", "WUENIC_PREV", "PAB"]
+DISEASES = ["CRS", "DIPHTHERIA", "INVASIVE_MENING", "JAPENC", "MEASLES", "MUMPS",
+            "NTETANUS", "PERTUSSIS", "POLIO", "RUBELLA", "TTETANUS", "YFEVER"]
+REGIONS = ["AFR", "AMR", "EMR", "EUR", "SEAR", "WPR"]
+
+# ======== SYNTHETIC DATA ========
+# Frames use exactly the column names a.py reads from the WHO exports.
+def _countries(rng):
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    codes = sorted({"".join(rng.choice(letters, 3)) for _ in range(N_COUNTRIES * 2)})[:N_COUNTRIES]
+    return pd.DataFrame({"ISO_3_CODE": codes,
+                         "COUNTRYNAME": [f"Country {c}" for c in codes],
+                         "WHO_REGION": rng.choice(REGIONS, len(codes))})
+
+def generate(rows, seed=0):
+    """Return the five WHO-shaped frames for a run with `rows` coverage rows."""
+    rng = np.random.default_rng(seed)
+    ctry = _countries(rng)
+    codes = ctry["ISO_3_CODE"].to_numpy()
+
+    def base(n, group=True):
+        pick = rng.integers(0, len(codes), n)
+        cols = {"GROUP": "COUNTRIES"} if group else {}
+        cols.update(CODE=codes[pick], NAME=ctry["COUNTRYNAME"].to_numpy()[pick], YEAR=rng.choice(YEARS, n))
+        return cols
+
+    target = rng.integers(1_000, 5_000_000, rows).astype(float)
+    doses = np.floor(target * rng.uniform(0.3, 1.1, rows))
+    coverage = pd.DataFrame({
+        **base(rows),
+        "ANTIGEN": rng.choice(ANTIGENS, rows),
+        "COVERAGE_CATEGORY": rng.choice(COVERAGE_CATEGORIES, rows),
+        "TARGET_NUMBER": target,
+        "DOSES": doses,
+        "COVERAGE": np.round(doses / target * 100, 2),
+    })
+    coverage.insert(5, "ANTIGEN_DESCRIPTION", coverage["ANTIGEN"] + " description")
+    coverage.insert(7, "COVERAGE_CATEGORY_DESCRIPTION", coverage["COVERAGE_CATEGORY"] + " estimates")
+
+    n = max(rows // 4, 1)
+    incidence = pd.DataFrame({**base(n), "DISEASE": rng.choice(DISEASES, n)})
+    incidence["DISEASE_DESCRIPTION"] = incidence["DISEASE"].str.title()
+    incidence["DENOMINATOR"] = "per 1,000,000 total population"
+    incidence["INCIDENCE_RATE"] = np.round(rng.exponential(20, n), 3)
+
+    reported = pd.DataFrame({**base(n), "DISEASE": rng.choice(DISEASES, n)})
+    reported["DISEASE_DESCRIPTION"] = reported["DISEASE"].str.title()
+    reported["CASES"] = rng.poisson(150, n).astype(float)
+
+    introduction = ctry.merge(pd.DataFrame({"YEAR": YEARS[-5:]}), how="cross")
+    introduction["DESCRIPTION"] = "Introduction of vaccine"
+    introduction["INTRO"] = rng.choice(["Yes", "No"], len(introduction))
+
+    m = max(rows // 8, 1)
+    pick = rng.integers(0, len(ctry), m)
+    schedule = pd.DataFrame({
+        "ISO_3_CODE": codes[pick],
+        "COUNTRYNAME": ctry["COUNTRYNAME"].to_numpy()[pick],
+        "WHO_REGION": ctry["WHO_REGION"].to_numpy()[pick],
+        "YEAR": rng.choice(YEARS, m),
+        "VACCINECODE": rng.choice(ANTIGENS, m),
+    })
+    schedule["VACCINE_DESCRIPTION"] = schedule["VACCINECODE"] + " description"
+    schedule["SCHEDULEROUNDS"] = rng.integers(1, 5, m)
+    schedule["TARGETPOP"] = rng.choice(["", "B", "F"], m)
+    schedule["TARGETPOP_DESCRIPTION"] = "General/routine"
+    schedule["GEOAREA"] = rng.choice(["NATIONAL", "SUBNATIONAL"], m)
+    schedule["AGEADMINISTERED"] = rng.choice(["B", "M2", "M4", "M6", "M9", "Y1"], m)
+    schedule["SOURCECOMMENT"] = None
+
+    return {"coverage": coverage, "incidence": incidence, "reported": reported,
+            "introduction": introduction, "schedule": schedule}
+
+def write_workbooks(frames, out_dir, fmt="xlsx"):
+    """Write the frames under a.FILES names; returns {key: path}.
+
+    Sheets longer than Excel allows are written as Parquet instead.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for key, df in frames.items():
+        stem = os.path.splitext(a.FILES[key])[0]
+        if fmt == "xlsx" and len(df) <= EXCEL_MAX_ROWS:
+            paths[key] = os.path.join(out_dir, stem + ".xlsx")
+            df.to_excel(paths[key], index=False)
+        else:
+            paths[key] = os.path.join(out_dir, stem + ".parquet")
+            df.to_parquet(paths[key], index=False)
+    return paths
+
+# ======== DATABASE ========
+def connect(target, work_dir):
+    """Return a fresh, empty database connection for one run."""
+    if target == "mysql":
+        cnx = backends.make("mysql", a.DB).pool(1).get_connection()
+        cur = cnx.cursor()
+        for table in ["coverage_data", "incidence_rate_data", "reported_cases_data", "vaccine_schedule_data",
+                      "countries", "vaccines", "diseases"]:
+            cur.execute(f"DELETE FROM {table}")
+        cnx.commit()
+        cur.close()
+        return cnx
+    path = os.path.join(work_dir, f"bench.{target}")
+    for stale in (path, path + ".wal"):
+        if os.path.exists(stale):
+            os.remove(stale)
+    cnx = backends.make(target, path=path).pool(1).get_connection()
+    cur = cnx.cursor()
+    cnx.backend.create_schema(cur)
+    cnx.commit()
+    cur.close()
+    return cnx
+
+# ======== BENCHMARK ========
+@contextlib.contextmanager
+def stage(report, name):
+    t0 = time.perf_counter()
+    yield
+    report[name] = report.get(name, 0.0) + time.perf_counter() - t0
+
+def read_input(path, key):
+    if path.endswith(".parquet"):
+        return a.apply_schema(pd.read_parquet(path), a.SCHEMAS[key])
+    return a.safe_read_excel(path, use_cache=False, schema=a.SCHEMAS[key])
+
+def run(rows, target, work_dir, fmt, batch_size):
+    """Generate a dataset, push it through every loader stage, return the report."""
+    frames = generate(rows)
+    paths = write_workbooks(frames, os.path.join(work_dir, f"data_{rows}"), fmt)
+    opts = a.parse_args(["--batch-size", str(batch_size)])
+    cnx = connect(target, work_dir)
+    cur = cnx.cursor()
+    times, counts = {}, {}
+
+    with stage(times, "excel_read"):
+        dfs = {k: read_input(p, k) for k, p in paths.items()}
+    with stage(times, "clean"):
+        for df in dfs.values():
+            a.clean_frame(df)
+    with stage(times, "master_upsert"):
+        meta = a.Metadata(cur)
+        meta.load_maps(cur)
+        a.upsert_countries(cnx, cur, meta, dfs["introduction"])
+        a.upsert_diseases(cnx, cur, meta, dfs["incidence"], dfs["reported"], verbose=False)
+        a.upsert_vaccines(cnx, cur, meta, dfs["coverage"], verbose=False)
+
+    for table, spec in a.MAPPINGS.items():
+        key = spec["source"]
+        cols, resolve, _ = a.compile_mapping(table, meta)
+        with stage(times, "fk_resolution"):
+            fact, _ = a.validate(resolve(dfs[key]), meta.tables.get(table, {}))
+        with stage(times, "fact_insert"):
+            inserted, _ = a.write_fact(cur, table, cols, fact, opts)
+            cnx.commit()
+        counts[table] = {"source": len(dfs[key]), "inserted": inserted}
+
+    cur.close()
+    cnx.close()
+    total_rows = sum(c["source"] for c in counts.values())
+    return {
+        "rows": rows,
+        "format": fmt,
+        "target": target,
+        "batch_size": batch_size,
+        "stages": {k: round(v, 4) for k, v in times.items()},
+        "total_seconds": round(sum(times.values()), 4),
+        "rows_per_sec": round(total_rows / max(sum(times.values()), 1e-9), 1),
+        "tables": counts,
+    }
+
+def compare(report, baseline):
+    """Print per-stage change against a previous report for the same scales."""
+    old = {(r["rows"], r["target"]): r for r in baseline.get("runs", [])}
+    for r in report["runs"]:
+        prev = old.get((r["rows"], r["target"]))
+        if not prev:
+            continue
+        print(f"\n📊 {r['rows']} rows vs baseline:")
+        for name, secs in r["stages"].items():
+            before = prev["stages"].get(name)
+            if before:
+                change = (secs - before) / before * 100
+                flag = "⚠️ " if change > 10 else "  "
+                print(f"  {flag}{name:<14} {before:8.3f}s -> {secs:8.3f}s ({change:+.0f}%)")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the a.py loader on synthetic WHO-shaped data.")
+    ap.add_argument("--rows", type=int, action="append",
+                    help=f"coverage rows per run; repeat for several scales (default {SCALES})")
+    ap.add_argument("--target", choices=sorted(backends.BACKENDS), default="sqlite",
+                    help="database to load into; mysql uses a.DB and empties its tables first")
+    ap.add_argument("--format", choices=["xlsx", "parquet"], default="xlsx",
+                    help="input format; sheets over the Excel row limit are always Parquet")
+    ap.add_argument("--batch-size", type=int, default=a.BATCH_SIZE)
+    ap.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "vaccination_bench"))
+    ap.add_argument("--out", default="bench_report.json", help="where to write the JSON report")
+    ap.add_argument("--baseline", help="previous JSON report to compare against")
+    args = ap.parse_args(argv)
+
+    runs = []
+    for rows in args.rows or SCALES:
+        print(f"⏳ {rows} rows -> {args.target} ...")
+        r = run(rows, args.target, args.work_dir, args.format, args.batch_size)
+        print(f"✅ {rows} rows: {r['total_seconds']}s total, {r['rows_per_sec']} rows/s  {r['stages']}")
+        runs.append(r)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "runs": runs,
+    }
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\n💾 Report written to {args.out}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            compare(report, json.load(fh))
+
+if __name__ == "__main__":
+    sys.exit(main())
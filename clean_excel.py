@@ -1,53 +1,136 @@
-import pandas as pd
+import argparse
 import glob
+import hashlib
+import json
 import os
-
-# 📂 Folder path where your Excel files are stored
-folder_path = r"C:\Users\medha\OneDrive\Desktop\Vaccination"   # <-- Change this path
-
-# 🔍 Get all Excel files (.xlsx) in the folder
-excel_files = glob.glob(os.path.join(folder_path, "*.xlsx"))
-
-# ✅ Check if files are found
-if not excel_files:
-    print("❌ No Excel files found in the folder!")
-    exit()
-else:
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 📂 Folder path where your Excel files are stored (or set VACCINATION_DATA_DIR)
+folder_path = os.environ.get("VACCINATION_DATA_DIR",
+                             r"C:\Users\medha\OneDrive\Desktop\Vaccination")   # <-- Change this path
+
+OUTPUT_PREFIX = "cleaned_"
+MANIFEST = ".clean_manifest.json"   # input name -> content hash of the last clean
+JOBS = 4
+
+def file_hash(path, block=1 << 20):
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def clean_file(path, write_xlsx=False, verbose=False):
+    """Drop duplicate rows from one workbook and write the cleaned_ outputs.
+
+    Runs in a worker process; returns (rows before, rows after, outputs).
+    """
+    # pandas is only imported once there is a workbook to clean, so a run
+    # that finds nothing changed starts and exits quickly
+    from cleaning import categorize, drop_duplicate_rows
+    from excel_cache import read_excel_cached, to_parquet
+    df = read_excel_cached(path)
+    if verbose:
+        print(f"\n📂 Cleaning File: {os.path.basename(path)}")
+        print("🔹 Columns:", list(df.columns))
+        print("🔹 First 5 rows:\n", df.head())
+
+    # 🧹 Remove duplicate rows based on ALL columns
+    before = len(df)
+    cleaned_df = drop_duplicate_rows(categorize(df))
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    base = os.path.join(os.path.dirname(path), OUTPUT_PREFIX + stem)
+    outputs = []
+    if write_xlsx:
+        # 💾 the Excel copy is only for people opening the data by hand;
+        # a.py reads the Parquet file, which is written last so it is the
+        # newer of the two (a.py falls back to a workbook newer than its twin)
+        outputs.append(base + ".xlsx")
+        cleaned_df.to_excel(outputs[-1], index=False)
+    outputs.append(base + ".parquet")
+    to_parquet(cleaned_df, outputs[-1])
+    return before, len(cleaned_df), outputs
+
+def load_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(folder, manifest):
+    fp = os.path.join(folder, MANIFEST)
+    with open(fp + ".tmp", "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(fp + ".tmp", fp)
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="De-duplicate the WHO workbooks into cleaned_*.parquet files.")
+    ap.add_argument("folder", nargs="?", default=folder_path,
+                    help="folder with the downloaded .xlsx files")
+    ap.add_argument("--jobs", type=int, default=JOBS,
+                    help=f"workbooks cleaned in parallel (default {JOBS})")
+    ap.add_argument("--xlsx", action="store_true",
+                    help="also write a cleaned_*.xlsx copy (slow; a.py does not need it)")
+    ap.add_argument("--force", action="store_true",
+                    help="re-clean every workbook, even if it has not changed")
+    ap.add_argument("--verbose", action="store_true",
+                    help="print each workbook's columns and first rows")
+    return ap.parse_args(argv)
+
+def main(argv=None):
+    opts = parse_args(argv)
+    folder = opts.folder
+
+    # 🔍 Get all Excel files (.xlsx) in the folder, except our own outputs and
+    # Excel's ~$ lock files
+    excel_files = sorted(f for f in glob.glob(os.path.join(folder, "*.xlsx"))
+                         if not os.path.basename(f).startswith((OUTPUT_PREFIX, "~$")))
+    if not excel_files:
+        print("❌ No Excel files found in the folder!")
+        return 1
     print(f"✅ Found {len(excel_files)} Excel files:")
     for file in excel_files:
         print(" -", os.path.basename(file))
 
-# 📄 Loop through each file one by one
-for file in excel_files:
-    try:
-        # Read the Excel file
-        df = pd.read_excel(file, engine="openpyxl")
-
-        # Show file name, columns, and first 5 rows
-        print(f"\n📂 Cleaning File: {os.path.basename(file)}")
-        print("🔹 Columns:", list(df.columns))    # Show column names
-        print("🔹 First 5 rows:\n", df.head())    # Show first 5 rows
-
-        # Show shape before removing duplicates
-        print("🔹 Shape before removing duplicates:", df.shape)
-
-        # 🧹 Remove duplicate rows based on ALL columns
-        cleaned_df = df.drop_duplicates()
-
-        # Show shape after removing duplicates
-        print("🔹 Shape after removing duplicates:", cleaned_df.shape)
-
-        # 💾 Save the cleaned DataFrame to a **new Excel file**
-        output_file = os.path.join(folder_path, f"cleaned_{os.path.basename(file)}")
-        cleaned_df.to_excel(output_file, index=False)
-
-        print(f"✅ Cleaned file saved as: {output_file}")
-
-    except Exception as e:
-        print(f"⚠️ Could not clean {os.path.basename(file)}: {e}")
-
-print("\n🎉 All files cleaned successfully!")
-
-
-
-
+    # skip workbooks whose content is unchanged since their outputs were written
+    manifest = load_manifest(folder)
+    todo = {}
+    for file in excel_files:
+        name = os.path.basename(file)
+        digest = file_hash(file)
+        entry = manifest.get(name, {})
+        if (not opts.force and entry.get("sha1") == digest
+                and all(os.path.exists(o) for o in entry.get("outputs", []))
+                and (not opts.xlsx or any(o.endswith(".xlsx") for o in entry.get("outputs", [])))):
+            print(f"⏭️  {name}: unchanged, skipping")
+            continue
+        todo[file] = digest
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, min(opts.jobs, len(todo) or 1))) as ex:
+        futures = {ex.submit(clean_file, file, opts.xlsx, opts.verbose): file for file in todo}
+        for f in as_completed(futures):
+            file = futures[f]
+            name = os.path.basename(file)
+            try:
+                before, after, outputs = f.result()
+            except Exception as e:
+                print(f"⚠️ Could not clean {name}: {e}")
+                failed += 1
+                continue
+            manifest[name] = {"sha1": todo[file], "outputs": outputs}
+            print(f"✅ {name}: {before} -> {after} rows, saved as "
+                  f"{', '.join(os.path.basename(o) for o in outputs)}")
+    save_manifest(folder, manifest)
+
+    if failed:
+        print(f"\n⚠️ {failed} file(s) could not be cleaned.")
+        return 1
+    print("\n🎉 All files cleaned successfully!")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+# Shared by clean_excel.py and a.py. Text is normalized per distinct value
+# rather than per cell, and duplicates are found on a 64-bit hash of each row,
+# so neither step builds a string copy of the whole frame.
+
+# Text columns with only a handful of distinct values in the WHO exports;
+# they are always kept as pandas categoricals once cleaned. Any other text
+# column is too when at most CATEGORY_MAX_RATIO of its values are distinct.
+LOW_CARDINALITY = ("WHO_REGION", "ANTIGEN", "COVERAGE_CATEGORY", "DISEASE")
+CATEGORY_MAX_RATIO = 0.5
+
+def is_text(s):
+    return s.dtype == object or isinstance(s.dtype, (pd.StringDtype, pd.CategoricalDtype))
+
+def strip_text(s, as_category=None):
+    """s with every value str()'d and stripped; missing values stay missing.
+
+    Only the distinct values are converted, then the result is rebuilt from
+    the integer codes. as_category=None picks a categorical when few values
+    are distinct (see CATEGORY_MAX_RATIO).
+    """
+    codes, uniques = pd.factorize(s)
+    remap, cats = pd.factorize(pd.Index([str(u).strip() for u in uniques], dtype=object))
+    codes = np.where(codes >= 0, remap.take(codes, mode="clip") if len(remap) else codes, -1)
+    if as_category is None:
+        as_category = len(cats) <= CATEGORY_MAX_RATIO * len(s)
+    if as_category:
+        return pd.Series(pd.Categorical.from_codes(codes, categories=cats), index=s.index, name=s.name)
+    out = np.asarray(cats, dtype=object).take(codes, mode="clip") if len(cats) else np.empty(len(s), dtype=object)
+    out[codes < 0] = None
+    return pd.Series(out, index=s.index, name=s.name, dtype=object)
+
+def normalize_text(df, categories=LOW_CARDINALITY):
+    """Strip every text column in place, turning repetitive ones into categoricals.
+
+    Columns that already are categoricals stay categoricals.
+    """
+    for c in df.columns:
+        if is_text(df[c]):
+            keep_cat = c in categories or isinstance(df[c].dtype, pd.CategoricalDtype)
+            df[c] = strip_text(df[c], as_category=True if keep_cat else None)
+    return df
+
+def categorize(df, categories=LOW_CARDINALITY):
+    """Turn the low-cardinality text columns present in df into categoricals, in place."""
+    for c in categories:
+        if c in df.columns and is_text(df[c]):
+            df[c] = df[c].astype("category")
+    return df
+
+def drop_duplicate_rows(df):
+    """df.drop_duplicates(inplace=True), matching rows on a 64-bit row hash.
+
+    A hash collision would drop a distinct row; at 10M rows the chance of
+    any collision is around 1 in 400,000.
+    """
+    if df.empty:
+        return df
+    if not df.index.is_unique:
+        df.reset_index(drop=True, inplace=True)
+    dup = pd.util.hash_pandas_object(df, index=False).duplicated().to_numpy()
+    if dup.any():
+        df.drop(index=df.index[dup], inplace=True)
+    return df
+
+# Ingestion schema per a.py FILES key, applied as each workbook is read:
+# categoricals for the dimension columns, the narrowest nullable integer that
+# holds the WHO values, and float32 for the coverage percentage.
+SCHEMAS = {
+    "coverage": {
+        "GROUP": "category", "CODE": "category", "NAME": "category",
+        "ANTIGEN": "category", "ANTIGEN_DESCRIPTION": "category",
+        "COVERAGE_CATEGORY": "category", "COVERAGE_CATEGORY_DESCRIPTION": "category",
+        "YEAR": "Int16", "TARGET_NUMBER": "Int32", "DOSES": "Int32", "COVERAGE": "float32",
+    },
+    "incidence": {
+        "GROUP": "category", "CODE": "category", "NAME": "category",
+        "DISEASE": "category", "DISEASE_DESCRIPTION": "category", "DENOMINATOR": "category",
+        "YEAR": "Int16",
+    },
+    "reported": {
+        "GROUP": "category", "CODE": "category", "NAME": "category",
+        "DISEASE": "category", "DISEASE_DESCRIPTION": "category",
+        "YEAR": "Int16", "CASES": "Int32",
+    },
+    "introduction": {
+        "ISO_3_CODE": "category", "COUNTRYNAME": "category", "WHO_REGION": "category",
+        "DESCRIPTION": "category", "INTRO": "category",
+        "YEAR": "Int16",
+    },
+    "schedule": {
+        "ISO_3_CODE": "category", "COUNTRYNAME": "category", "WHO_REGION": "category",
+        "VACCINECODE": "category", "VACCINE_DESCRIPTION": "category",
+        "TARGETPOP": "category", "TARGETPOP_DESCRIPTION": "category",
+        "GEOAREA": "category", "AGEADMINISTERED": "category",
+        "YEAR": "Int16",
+    },
+}
+
+def apply_schema(df, schema):
+    """Cast df's columns to the dtypes in schema, in place; absent columns are skipped.
+
+    Headers are stripped first, so a padded "YEAR " still matches. Numbers
+    are coerced the way a.py's int_col/dec_col read them: anything
+    non-numeric becomes missing and integers are truncated. An integer
+    column whose values do not fit the declared width is kept as Int64, or
+    as float64 if they do not fit that either (validation rejects those rows).
+    """
+    if df is None or not schema:
+        return df
+    df.columns = [c.strip() if isinstance(c, str) else c for c in df.columns]
+    for c, dtype in schema.items():
+        if c not in df.columns:
+            continue
+        if dtype == "category":
+            df[c] = df[c].astype("category")
+            continue
+        v = pd.to_numeric(df[c], errors="coerce").astype("float64").replace([np.inf, -np.inf], np.nan)
+        if dtype.startswith("Int"):
+            v = np.trunc(v)
+            info = np.iinfo(dtype.lower())
+            if v.min() < info.min or v.max() > info.max:
+                dtype = "Int64"
+                if v.min() < -2.0 ** 63 or v.max() >= 2.0 ** 63:
+                    dtype = "float64"
+        df[c] = v.astype(dtype)
+    return df
@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+
+# Entry point for scheduled runs:
+#
+#   python cli.py [settings] clean [folder] [clean_excel.py options]
+#   python cli.py [settings] load [--table TABLE ...] [a.py options]
+#   python cli.py [settings] validate [--table TABLE ...] [a.py options]
+#
+# Only the standard library is imported here. pandas, the DB drivers and the
+# loader modules are imported by the subcommand that runs, so --help, or a
+# clean with nothing to do, starts in milliseconds. `<command> --help` lists
+# the subcommand's own options.
+#
+# The settings below override the environment variables a.py and
+# clean_excel.py read their defaults from.
+
+SETTINGS = [
+    # option, environment variable, help
+    ("--data-dir", "VACCINATION_DATA_DIR", "folder with the workbooks"),
+    ("--backend", "VACCINATION_BACKEND", "mysql, sqlite or duckdb"),
+    ("--db-file", "VACCINATION_DB_FILE", "database file for sqlite/duckdb"),
+    ("--db-host", "VACCINATION_DB_HOST", "MySQL host"),
+    ("--db-port", "VACCINATION_DB_PORT", "MySQL port"),
+    ("--db-user", "VACCINATION_DB_USER", "MySQL user"),
+    ("--db-password", "VACCINATION_DB_PASSWORD", "MySQL password; better set in the environment"),
+    ("--db-name", "VACCINATION_DB_NAME", "MySQL database"),
+]
+
+def clean(args):
+    import clean_excel
+    return clean_excel.main(args)
+
+def load(args):
+    import a
+    try:
+        a.main(args)
+    except Exception as e:
+        import traceback
+        print("❌ Unexpected error:\n", e)
+        traceback.print_exc()
+        return 1
+    return 0
+
+def validate(args):
+    return load(["--validate"] + args)
+
+COMMANDS = {
+    "clean": (clean, "de-duplicate the downloaded workbooks into cleaned_* files"),
+    "load": (load, "load the cleaned workbooks into the database (--table X for one table)"),
+    "validate": (validate, "dry run: check the fact rows and write the rejects files, load nothing"),
+}
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="WHO vaccination data pipeline.",
+                                 epilog="Settings go before the command; everything after it is "
+                                        "passed to the command.")
+    for flag, env, text in SETTINGS:
+        ap.add_argument(flag, metavar="VALUE", help=f"{text} (env {env})")
+    sub = ap.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, text) in COMMANDS.items():
+        # no -h of their own: --help after the command reaches its real parser
+        sub.add_parser(name, help=text, add_help=False)
+    return ap.parse_known_args(argv)
+
+def main(argv=None):
+    opts, rest = parse_args(argv)
+    for flag, env, _ in SETTINGS:
+        value = getattr(opts, flag[2:].replace("-", "_"))
+        if value is not None:
+            os.environ[env] = value
+    return COMMANDS[opts.command][0](rest)
+
+if __name__ == "__main__":
+    sys.exit(main())
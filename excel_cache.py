@@ -0,0 +1,66 @@
+import glob
+import hashlib
+import os
+import pandas as pd
+
+# Parsed sheets are cached next to the workbooks, one file per sheet, named
+# <workbook stem>-<key>.parquet. The key covers the absolute path, mtime, size
+# and sheet, so editing or replacing a workbook simply misses the cache.
+CACHE_DIR_NAME = ".excel_cache"
+KEY_LEN = 16
+
+def cache_key(path, sheet_name=0):
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{sheet_name}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:KEY_LEN]
+
+def to_parquet(df, path):
+    """Write df as Parquet via a temp file, so readers never see half a file.
+
+    Object columns mixing numbers and text cannot be stored by pyarrow, so
+    their non-null values are written as text. Returns the frame as written.
+    """
+    tmp = path + ".tmp"
+    try:
+        df.to_parquet(tmp, index=False)
+    except Exception:
+        df = df.copy()
+        for c in df.select_dtypes(include=["object"]).columns:
+            df[c] = df[c].map(lambda v: v if pd.isna(v) else str(v))
+        df.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return df
+
+def read_excel_cached(path, sheet_name=0, cache_dir=None):
+    """pd.read_excel, reusing a Parquet copy of the sheet until the workbook changes.
+
+    Mixed object columns come back as text (see to_parquet), on the first
+    read as on later ones.
+    """
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    key = cache_key(path, sheet_name)
+
+    fp = os.path.join(cache_dir, f"{stem}-{key}.parquet")
+    if os.path.exists(fp):
+        try:
+            return pd.read_parquet(fp)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable cache {os.path.basename(fp)}: {e}")
+
+    df = pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl")
+    try:
+        df = _store(df, cache_dir, stem, key)
+    except OSError as e:
+        print(f"⚠️  Could not cache {os.path.basename(path)}: {e}")
+    return df
+
+def _store(df, cache_dir, stem, key):
+    os.makedirs(cache_dir, exist_ok=True)
+    # drop entries for older versions of this workbook
+    for old in glob.glob(os.path.join(cache_dir, glob.escape(stem) + "-*")):
+        name, _ = os.path.splitext(os.path.basename(old))
+        if len(name) == len(stem) + 1 + KEY_LEN:
+            os.remove(old)
+
+    return to_parquet(df, os.path.join(cache_dir, f"{stem}-{key}.parquet"))
@@ -0,0 +1,139 @@
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Stage timings for a.py. Stages are recorded on a module-level profiler so the
+# loaders can report rows without threading it through every call; each
+# thread has its own stack of open stages, which is what lets the parallel fact
+# loaders count their own DB calls.
+_local = threading.local()
+_lock = threading.Lock()
+_records = []
+_t0 = time.perf_counter()
+_cprofile_stages = set()
+_cprofile_dir = None
+
+def configure(cprofile_stages=(), cprofile_dir=None):
+    """Reset recorded stages; stages named in cprofile_stages also dump a .prof file."""
+    global _t0, _cprofile_stages, _cprofile_dir
+    with _lock:
+        _records.clear()
+    _t0 = time.perf_counter()
+    _cprofile_stages = set(cprofile_stages)
+    _cprofile_dir = cprofile_dir
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB, or None if it cannot be read."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    return None
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+@contextlib.contextmanager
+def stage(name, rows=0, bytes_read=0):
+    """Time a block and record it as one stage of the run."""
+    rec = {"stage": name, "thread": threading.current_thread().name,
+           "rows": rows, "bytes_read": bytes_read, "db_calls": 0}
+    stack = _stack()
+    stack.append(rec)
+    prof = None
+    if name in _cprofile_stages:
+        prof = cProfile.Profile()
+        prof.enable()
+    start = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        wall = time.perf_counter() - start
+        if prof is not None:
+            prof.disable()
+            fp = os.path.join(_cprofile_dir or ".", f"{name.replace(':', '_')}.prof")
+            prof.dump_stats(fp)
+            rec["cprofile"] = fp
+        stack.pop()
+        if stack:
+            stack[-1]["db_calls"] += rec["db_calls"]
+        rec.update(start_s=round(start - _t0, 4), wall_s=round(wall, 4),
+                   rows_per_sec=round(rec["rows"] / wall, 1) if rec["rows"] and wall > 0 else None,
+                   peak_rss_mb=peak_rss_mb())
+        with _lock:
+            _records.append(rec)
+
+def count(rows=0, bytes_read=0):
+    """Add rows / bytes to the innermost open stage on this thread."""
+    stack = _stack()
+    if stack:
+        stack[-1]["rows"] += rows
+        stack[-1]["bytes_read"] += bytes_read
+
+class CountingCursor:
+    """Cursor proxy that counts execute/executemany calls against the open stage."""
+
+    def __init__(self, cur):
+        self._cur = cur
+
+    def execute(self, *args, **kwargs):
+        self._tick()
+        return self._cur.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._tick()
+        return self._cur.executemany(*args, **kwargs)
+
+    def _tick(self):
+        stack = _stack()
+        if stack:
+            stack[-1]["db_calls"] += 1
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+def records():
+    with _lock:
+        return sorted(_records, key=lambda r: r["start_s"])
+
+def write_trace(path, fmt="jsonl"):
+    """Write the recorded stages as JSON lines, or as a Chrome trace (chrome://tracing)."""
+    recs = records()
+    with open(path, "w", encoding="utf-8") as fh:
+        if fmt == "chrome":
+            tids = {}
+            events = [{"name": r["stage"], "ph": "X", "pid": os.getpid(),
+                       "tid": tids.setdefault(r["thread"], len(tids)),
+                       "ts": int(r["start_s"] * 1e6), "dur": int(r["wall_s"] * 1e6),
+                       "args": {k: v for k, v in r.items() if k not in ("stage", "start_s", "wall_s")}}
+                      for r in recs]
+            events += [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                        "args": {"name": thread}} for thread, tid in tids.items()]
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, fh)
+        else:
+            for r in recs:
+                fh.write(json.dumps(r) + "\n")
+
+def print_summary():
+    print("\n⏱️  Stage timings:")
+    for r in records():
+        rate = f"{r['rows_per_sec']:>10.0f} rows/s" if r["rows_per_sec"] else " " * 16
+        print(f"  {r['stage']:<28} {r['wall_s']:8.2f}s {r['rows']:>9} rows {rate} "
+              f"{r['db_calls']:>6} db calls  peak {r['peak_rss_mb']} MiB")
@@ -0,0 +1,221 @@
+import time
+from collections import defaultdict
+
+# Summary tables for the dashboards, rebuilt from the fact tables after a
+# load. Each is refreshed one (country, year) partition at a time -- only the
+# partitions the load wrote to -- by deleting them and re-aggregating with
+# INSERT ... SELECT; the regional tables are then re-aggregated for the
+# (region, year) pairs those countries belong to. A report table that does
+# not exist yet is created and filled from scratch.
+#
+# The queries use the fact tables' standard column names (country_id,
+# vaccine_id, disease_id, year, ...); a report whose columns are missing is
+# skipped.
+
+PARTITION_BATCH = 500   # country ids per DELETE / INSERT ... SELECT
+
+TABLES = {
+    "report_coverage": """
+        CREATE TABLE IF NOT EXISTS report_coverage (
+            country_id INT NOT NULL,
+            vaccine_id INT NOT NULL,
+            year INT NOT NULL,
+            coverage_category VARCHAR(50) NOT NULL,
+            avg_coverage DECIMAL(10,2),
+            doses BIGINT,
+            target_number BIGINT,
+            n_rows INT NOT NULL,
+            PRIMARY KEY (country_id, vaccine_id, year, coverage_category)
+        )""",
+    "report_coverage_region": """
+        CREATE TABLE IF NOT EXISTS report_coverage_region (
+            who_region VARCHAR(50) NOT NULL,
+            vaccine_id INT NOT NULL,
+            year INT NOT NULL,
+            coverage_category VARCHAR(50) NOT NULL,
+            avg_coverage DECIMAL(10,2),
+            doses BIGINT,
+            target_number BIGINT,
+            countries INT NOT NULL,
+            PRIMARY KEY (who_region, vaccine_id, year, coverage_category)
+        )""",
+    "report_disease_country": """
+        CREATE TABLE IF NOT EXISTS report_disease_country (
+            country_id INT NOT NULL,
+            disease_id INT NOT NULL,
+            year INT NOT NULL,
+            cases BIGINT,
+            incidence_rate DECIMAL(12,3),
+            PRIMARY KEY (country_id, disease_id, year)
+        )""",
+    "report_disease_region": """
+        CREATE TABLE IF NOT EXISTS report_disease_region (
+            who_region VARCHAR(50) NOT NULL,
+            disease_id INT NOT NULL,
+            year INT NOT NULL,
+            cases BIGINT,
+            avg_incidence_rate DECIMAL(12,3),
+            countries_reporting INT NOT NULL,
+            PRIMARY KEY (who_region, disease_id, year)
+        )""",
+}
+
+# (table, index name, columns): partition lookups on the fact tables, and
+# the year-first access paths the dashboards filter on.
+INDEXES = [
+    ("coverage_data", "ix_coverage_country_year", "country_id, year"),
+    ("incidence_rate_data", "ix_incidence_country_year", "country_id, year"),
+    ("reported_cases_data", "ix_reported_country_year", "country_id, year"),
+    ("report_coverage", "ix_report_coverage_year", "year, vaccine_id"),
+    ("report_coverage_region", "ix_report_coverage_region_year", "year, vaccine_id"),
+    ("report_disease_country", "ix_report_disease_country_year", "year, disease_id"),
+    ("report_disease_region", "ix_report_disease_region_year", "year, disease_id"),
+]
+
+# Country-level reports: fact tables read, required columns, and the
+# INSERT ... SELECT with a {where} filter on the fact rows.
+COUNTRY_REPORTS = {
+    "report_coverage": (
+        {"coverage_data": {"country_id", "vaccine_id", "year", "coverage_category",
+                           "coverage", "doses", "target_number"}},
+        """
+        INSERT INTO report_coverage (country_id, vaccine_id, year, coverage_category,
+                                     avg_coverage, doses, target_number, n_rows)
+        SELECT country_id, vaccine_id, year, COALESCE(coverage_category, ''),
+               AVG(coverage), SUM(doses), SUM(target_number), COUNT(*)
+        FROM coverage_data
+        WHERE year IS NOT NULL AND {where}
+        GROUP BY country_id, vaccine_id, year, COALESCE(coverage_category, '')"""),
+    "report_disease_country": (
+        {"reported_cases_data": {"country_id", "disease_id", "year", "cases"},
+         "incidence_rate_data": {"country_id", "disease_id", "year", "incidence_rate"}},
+        """
+        INSERT INTO report_disease_country (country_id, disease_id, year, cases, incidence_rate)
+        SELECT country_id, disease_id, year, SUM(cases), AVG(incidence_rate)
+        FROM (
+            SELECT country_id, disease_id, year, cases, NULL AS incidence_rate
+            FROM reported_cases_data WHERE year IS NOT NULL AND {where}
+            UNION ALL
+            SELECT country_id, disease_id, year, NULL, incidence_rate
+            FROM incidence_rate_data WHERE year IS NOT NULL AND {where}
+        ) u
+        GROUP BY country_id, disease_id, year"""),
+}
+
+# Regional reports, aggregated from a country-level report joined to
+# countries (whose id column is {cid}); {where} filters on r.year and the region.
+REGION_REPORTS = {
+    "report_coverage_region": ("report_coverage", """
+        INSERT INTO report_coverage_region (who_region, vaccine_id, year, coverage_category,
+                                            avg_coverage, doses, target_number, countries)
+        SELECT COALESCE(c.who_region, ''), r.vaccine_id, r.year, r.coverage_category,
+               AVG(r.avg_coverage), SUM(r.doses), SUM(r.target_number), COUNT(*)
+        FROM report_coverage r JOIN countries c ON c.{cid} = r.country_id
+        WHERE {where}
+        GROUP BY COALESCE(c.who_region, ''), r.vaccine_id, r.year, r.coverage_category"""),
+    "report_disease_region": ("report_disease_country", """
+        INSERT INTO report_disease_region (who_region, disease_id, year, cases,
+                                           avg_incidence_rate, countries_reporting)
+        SELECT COALESCE(c.who_region, ''), r.disease_id, r.year, SUM(r.cases),
+               AVG(r.incidence_rate), COUNT(*)
+        FROM report_disease_country r JOIN countries c ON c.{cid} = r.country_id
+        WHERE {where}
+        GROUP BY COALESCE(c.who_region, ''), r.disease_id, r.year"""),
+}
+
+def ensure_indexes(cur, tables):
+    """Create the INDEXES missing on the tables that exist."""
+    have = {(t.lower(), i.lower()) for t, i in cur.backend.indexes(cur)}
+    for table, name, cols in INDEXES:
+        if table in tables and (table, name) not in have:
+            cur.execute(f"CREATE INDEX {name} ON {table} ({cols})")
+            print(f"✅ index {name} created on {table}({cols})")
+
+def by_year(partitions, batch=PARTITION_BATCH):
+    """Group (country_id, year) pairs into (year, [country ids]) batches."""
+    years = defaultdict(set)
+    for country_id, year in partitions:
+        if country_id is not None and year is not None:
+            years[int(year)].add(int(country_id))
+    for year, ids in sorted(years.items()):
+        ids = sorted(ids)
+        for start in range(0, len(ids), batch):
+            yield year, ids[start:start + batch]
+
+def refresh_country_report(cur, table, insert_sql, partitions, rebuild):
+    """Delete and re-aggregate table's touched partitions; returns rows written."""
+    if rebuild:
+        cur.execute(f"DELETE FROM {table}")
+        cur.execute(insert_sql.format(where="1 = 1"))
+        return cur.rowcount
+    written = 0
+    for year, ids in by_year(partitions):
+        marks = ", ".join(["%s"] * len(ids))
+        cur.execute(f"DELETE FROM {table} WHERE year = %s AND country_id IN ({marks})", (year, *ids))
+        where = f"year = %s AND country_id IN ({marks})"
+        params = (year, *ids) * insert_sql.count("{where}")
+        cur.execute(insert_sql.format(where=where), params)
+        written += cur.rowcount
+    return written
+
+def refresh_region_report(cur, table, insert_sql, partitions, rebuild, cid="id"):
+    """Re-aggregate the (region, year) pairs of the touched countries; cid is countries' id column."""
+    if rebuild:
+        cur.execute(f"DELETE FROM {table}")
+        cur.execute(insert_sql.format(where="1 = 1", cid=cid))
+        return cur.rowcount
+    # regions of the touched countries, per year
+    regions = defaultdict(set)
+    for year, ids in by_year(partitions):
+        cur.execute(f"SELECT DISTINCT COALESCE(who_region, '') FROM countries "
+                    f"WHERE {cid} IN ({', '.join(['%s'] * len(ids))})", tuple(ids))
+        regions[year].update(r for (r,) in cur.fetchall())
+    written = 0
+    for year, names in sorted(regions.items()):
+        names = sorted(names)
+        marks = ", ".join(["%s"] * len(names))
+        cur.execute(f"DELETE FROM {table} WHERE year = %s AND who_region IN ({marks})", (year, *names))
+        cur.execute(insert_sql.format(where=f"r.year = %s AND COALESCE(c.who_region, '') IN ({marks})", cid=cid),
+                    (year, *names))
+        written += cur.rowcount
+    return written
+
+def refresh_reports(cnx, cur, meta, touched, rebuild=False):
+    """Bring the report tables up to date after a load.
+
+    touched maps each fact table to the (country_id, year) pairs the load
+    wrote; rebuild=True re-aggregates everything.
+    """
+    has_region = "who_region" in meta.columns("countries")
+    created = [t for t in TABLES if t not in meta.tables]
+    for ddl in TABLES.values():
+        cur.execute(ddl)
+    ensure_indexes(cur, set(meta.tables) | set(TABLES))
+
+    done = {}
+    for table, (sources, insert_sql) in COUNTRY_REPORTS.items():
+        missing = [f"{src}.{c}" for src, cols in sources.items() for c in sorted(cols - meta.columns(src))]
+        if missing:
+            print(f"⚠️  {table}: skipped, missing column(s) {', '.join(missing)}")
+            continue
+        t0 = time.perf_counter()
+        full = rebuild or table in created
+        partitions = set().union(*(touched.get(src, ()) for src in sources))
+        n = refresh_country_report(cur, table, insert_sql, partitions, full)
+        cnx.commit()
+        done[table] = (partitions, full)
+        print(f"✅ {table}: {'rebuilt' if full else f'{len(partitions)} partition(s) refreshed'}, "
+              f"{n} rows [{time.perf_counter() - t0:.1f}s]")
+
+    for table, (source, insert_sql) in REGION_REPORTS.items():
+        if source not in done:
+            continue
+        if not has_region:
+            print(f"⚠️  {table}: skipped, countries has no who_region column")
+            continue
+        t0 = time.perf_counter()
+        partitions, full = done[source]
+        full = full or rebuild or table in created
+        n = refresh_region_report(cur, table, insert_sql, partitions, full, meta.master_keys["countries"][0])
+        cnx.commit()
+        print(f"✅ {table}: {'rebuilt' if full else 'refreshed'}, {n} rows [{time.perf_counter() - t0:.1f}s]")
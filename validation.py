@@ -0,0 +1,168 @@
+import os
+import threading
+from collections import Counter
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+# Pre-insert checks for the fact frames a.py's resolvers build. Each check is
+# a whole-column comparison; rows failing any of them are held back from the
+# INSERT and written, as the source rows plus their reason codes, to a
+# per-table rejects file. The server should then accept everything it is sent.
+#
+# Reason codes (several are joined with "; "):
+#   missing_fk:<col>  no master row for the id column (unknown country, vaccine, ...)
+#   type:<col>        number that does not fit the column's integer type, or is infinite
+#   range:<col>       number outside RANGES
+#   too_long:<col>    text longer than the column's declared length
+#   duplicate_key     --incremental: a later source row has the same natural key
+#   db:<error>        rejected by the server after all (e.g. a unique or CHECK constraint)
+#
+# frame_rows and db_rejects are shared by a.py's loaders and async_load.py.
+
+COVERAGE_MAX = 1000     # % -- admin coverage runs over 100 when the target population is stale
+RANGES = {
+    "year": (1900, date.today().year + 1),
+    "coverage": (0, COVERAGE_MAX),
+    "target_number": (0, None),
+    "doses": (0, None),
+    "cases": (0, None),
+    "incidence_rate": (0, None),
+}
+REQUIRED = ("country_id", "vaccine_id", "disease_id")   # ids looked up in the master tables
+INT_BITS = {"tinyint": 8, "smallint": 16, "mediumint": 24, "int": 32, "integer": 32, "bigint": 64}
+
+def frame_rows(frame):
+    """Insert tuples for a fact frame.
+
+    Values are converted to plain Python objects (None for missing) so the
+    connector can bind them.
+    """
+    arrays = [frame[c].to_numpy(dtype=object, na_value=None) for c in frame.columns]
+    return list(zip(*arrays))
+
+def db_rejects(fact, rejected):
+    """Reason codes, indexed by source row position, for the rows the server refused.
+
+    rejected holds the (insert tuple, error) pairs a.insert_batched or
+    async_load.insert_chunk returned for rows of fact.
+    """
+    where = {row: i for i, row in zip(fact.index, frame_rows(fact))}
+    return pd.Series({where[row]: f"db:{str(e).splitlines()[0]}" for row, e in rejected if row in where},
+                     dtype=object)
+
+def checks(frame, types):
+    """Yield (reason code, bad-row mask) for every check that applies to frame.
+
+    types is the table's {column: (data type, max length)} from Metadata.
+    """
+    for c in frame.columns:
+        s = frame[c]
+        data_type, max_len = types.get(c, (None, None))
+        if c in REQUIRED:
+            yield f"missing_fk:{c}", s.isna().to_numpy()
+        if pd.api.types.is_numeric_dtype(s.dtype):
+            v = s.astype("float64").to_numpy()
+            bad = np.isinf(v)
+            bits = INT_BITS.get((data_type or "").split("(")[0])
+            if bits:
+                bad |= (v < -2.0 ** (bits - 1)) | (v >= 2.0 ** (bits - 1))
+            yield f"type:{c}", bad
+            if c in RANGES:
+                lo, hi = RANGES[c]
+                with np.errstate(invalid="ignore"):
+                    low = v < lo if lo is not None else False
+                    high = v > hi if hi is not None else False
+                yield f"range:{c}", low | high
+        elif max_len:
+            lengths = pd.to_numeric(s.str.len(), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            with np.errstate(invalid="ignore"):
+                yield f"too_long:{c}", lengths > max_len
+
+def validate(frame, types):
+    """Split a resolved fact frame into (rows to insert, reasons).
+
+    reasons is a Series of reason codes indexed like the rejected rows of frame.
+    """
+    found = [(code, mask) for code, mask in checks(frame, types) if np.any(mask)]
+    if not found:
+        return frame, pd.Series([], dtype=object)
+    bad = np.logical_or.reduce([mask for _, mask in found])
+    reasons = pd.Series("", index=frame.index[bad], dtype=object)
+    for code, mask in found:
+        hit = mask[bad]
+        reasons[hit] = reasons[hit] + "; " + code
+    return restore_ints(frame[~bad], types), reasons.str[2:]
+
+def restore_ints(frame, types):
+    """Integer columns that a.int_col left as floats (values too big for Int64) back as Int64.
+
+    Only done once the oversized rows are rejected, and only for whole numbers.
+    """
+    for c in frame.columns:
+        v = frame[c]
+        if v.dtype != np.float64 or not INT_BITS.get((types.get(c, (None, None))[0] or "").split("(")[0]):
+            continue
+        if (v.isna() | (v == np.trunc(v))).all():
+            frame = frame.assign(**{c: v.astype("Int64")})
+    return frame
+
+class Rejects:
+    """Rejected rows of one fact table, appended to <directory>/<table>_rejects.<fmt>.
+
+    Values are written as text, so chunks with differently typed columns
+    still fit one file. add() may be called from several threads. CSV files
+    are appended to when keep is set (--resume); otherwise any old file is
+    removed when the run starts. A Parquet file cannot be appended to, so it
+    is always started over.
+    """
+
+    def __init__(self, table, directory, fmt="csv", keep=False):
+        self.path = os.path.join(directory, f"{table}_rejects.{fmt}")
+        self.fmt = fmt
+        keep = keep and fmt == "csv"
+        self.append = keep and os.path.exists(self.path)
+        self.count = 0
+        self.reasons = Counter()
+        self._writer = None
+        self._lock = threading.Lock()
+        if not keep and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def add(self, source, reasons):
+        """Write source's rows at the positions in reasons' index, with their reason codes."""
+        if reasons.empty:
+            return
+        out = source.iloc[reasons.index.to_numpy()].reset_index(drop=True)
+        out = out.astype(str).astype(object).where(out.notna(), None)
+        out.insert(0, "reject_reason", reasons.to_numpy())
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            if self.fmt == "csv":
+                first = not (self.count or self.append)
+                out.to_csv(self.path, mode="w" if first else "a", header=first, index=False)
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                table = pa.Table.from_pandas(out, schema=pa.schema([(c, pa.string()) for c in out.columns]),
+                                             preserve_index=False)
+                if self._writer is None:
+                    self._writer = pq.ParquetWriter(self.path, table.schema)
+                self._writer.write_table(table)
+            self.count += len(out)
+            self.reasons.update(reasons.str.split("; ").explode().value_counts().to_dict())
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def summary(self, top=3):
+        """'N rejected (code n, ...) -> path', or '' when nothing was rejected."""
+        if not self.count:
+            return ""
+        common = ", ".join(f"{code} {n}" for code, n in self.reasons.most_common(top))
+        more = ", ..." if len(self.reasons) > top else ""
+        return f"{self.count} rejected ({common}{more}) -> {self.path}"